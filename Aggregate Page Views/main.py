@@ -6,6 +6,8 @@ from dotenv import load_dotenv
 # for local dev, load env vars from a .env file
 load_dotenv()
 
+import tracing
+
 # Initialize the Quix Application with the connection configuration
 app = Application(consumer_group=os.getenv("consumer_group_name","default-consumer-group"),
                   auto_offset_reset="earliest")
@@ -35,7 +37,13 @@ sdf = sdf.apply(add_key_to_payload, metadata=True) # Adding the key (page_id) to
 
 sdf = sdf.update(lambda row: print(f"Received row: {row}"))
 
+# Record the latency of the event so far, and pass its trace on to the next stage
+sdf = sdf.update(lambda value, key, timestamp, headers: tracing.observe("aggregate_page_views", headers),
+                 metadata=True)
+sdf = sdf.set_headers(lambda value, key, timestamp, headers: tracing.forward(headers))
+
 sdf = sdf.to_topic(output_topic)
 
 if __name__ == "__main__":
+    tracing.start()
     app.run(sdf)
\ No newline at end of file
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+cache_ttl = float(os.getenv("cache_ttl", "1.0"))  # seconds, 0 disables caching
+cache_max_entries = int(os.getenv("cache_max_entries", "256"))
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    mimetype: str
+    headers: dict
+    etag: str
+    expires_at: float
+
+
+class ResponseCache:
+    """
+    Shares rendered responses between all requests for the same key.
+
+    An entry is rendered at most once per `ttl` seconds: while it is being
+    rendered, other requests for the same key wait for the result instead of
+    querying the database themselves. Each entry carries an ETag made from a
+    hash of its body, so clients polling unchanged data can be answered with a
+    304 Not Modified.
+    """
+
+    def __init__(self, ttl: float = cache_ttl, max_entries: int = cache_max_entries):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}  # key -> [lock, number of requests holding or waiting for it]
+
+    def get(self, key, render) -> CachedResponse:
+        """
+        Return the cached response for `key`, calling `render()` to produce a fresh
+        `(body, mimetype, headers)` when it is missing or expired.
+        """
+        if self._ttl <= 0:
+            return self._render(render)
+
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                # Another request may have rendered it while we were waiting
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry
+
+                # On failure nothing is stored, and the next waiter renders it in turn
+                entry = self._render(render)
+                self._store(key, entry)
+                return entry
+        finally:
+            # Dropped by the last request using it, so every request for the key shares the same lock
+            with self._lock:
+                key_lock[1] -= 1
+                if key_lock[1] == 0:
+                    del self._key_locks[key]
+
+    def _render(self, render):
+        body, mimetype, headers = render()
+        return CachedResponse(
+            body=body,
+            mimetype=mimetype,
+            headers=headers,
+            etag=hashlib.sha1(body).hexdigest(),
+            expires_at=time.monotonic() + self._ttl,
+        )
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
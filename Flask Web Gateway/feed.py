@@ -0,0 +1,245 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+feed_enabled = os.getenv("feed_enabled", "true").lower() == "true"
+feed_topic = os.getenv("feed_topic", "processed_data")
+feed_consumer_group = os.getenv("feed_consumer_group", f"gateway-feed-{socket.gethostname()}")
+feed_history = int(os.getenv("feed_history", "100000"))  # number of changes kept for clients catching up
+feed_timeout = float(os.getenv("feed_timeout", "25"))  # longest wait of a long-poll or between keep-alives
+feed_max_backoff = float(os.getenv("feed_max_backoff", "60"))  # longest wait before reconnecting the consumer
+
+
+class FeedUnavailable(Exception):
+    """
+    Raised when the in-memory page counts are requested before they are loaded.
+    """
+
+
+class ChangeFeed(threading.Thread):
+    """
+    Follows the `processed_data` topic and tells clients which page counts changed.
+
+    A single consumer is shared by all clients. Every change gets a sequence
+    number and the page ids are kept in a bounded log, so a client only has to
+    remember the last sequence number it saw to get the latest counts of the
+    pages changed since. Clients that fall further behind than the log reaches
+    are told to reload the full table instead.
+
+    With `replay`, the topic is read from the beginning on startup to rebuild the
+    latest count of every page, and `snapshot` then holds them as an immutable
+    Arrow table. The replay is complete once the consumer's position in every
+    assigned partition has reached the end offset it had at assignment. Each
+    batch of changes publishes a new table, so readers use whichever one they
+    picked up without any locking.
+
+    A record without a value (a tombstone) deletes its page, and records that
+    can't be decoded are logged and skipped. When the consumer fails it is
+    created again after a backoff, and `available` is False until it is back,
+    and in replay mode until the topic has been read up to its end again.
+    Clients are told to reload, since changes may have been missed meanwhile.
+    """
+
+    def __init__(self, topic: str = feed_topic, consumer_group: str = feed_consumer_group,
+                 history: int = feed_history, replay: bool = False):
+        super().__init__(name="change-feed", daemon=True)
+        self._topic = topic
+        self._consumer_group = consumer_group
+        self._replay = replay
+        self._counts = {}
+        self._log = deque(maxlen=history)  # (seq, page_id) of the most recent changes
+        self._seq = 0
+        self._changed = threading.Condition()
+        self._catching_up = {}  # partition -> (TopicPartition, offset to reach before the replay is complete)
+        self._assigned = False
+        # Kept in page_id order for the snapshots, so publishing one doesn't sort the whole table
+        self._page_ids = []
+        self._page_index = {}  # page_id -> position in _page_ids and _page_counts
+        self._page_counts = np.zeros(0, np.int32)
+        self._page_id_array = pa.array([], pa.string())
+        self.available = False
+        self.snapshot = None
+
+    @property
+    def seq(self):
+        with self._changed:
+            return self._seq
+
+    def run(self):
+        backoff = 1.0
+        while True:
+            started = time.monotonic()
+            try:
+                self._follow()
+            except Exception:
+                logger.exception(f"Change feed failed, reconnecting in {backoff:.0f}s")
+            self.available = False
+            self._restart()
+            if time.monotonic() - started > feed_max_backoff:
+                backoff = 1.0  # it had been running fine, not a failure in a row
+            time.sleep(backoff)
+            backoff = min(feed_max_backoff, backoff * 2)
+
+    def _follow(self):
+        # Imported here so the gateway can run without Kafka when the feed is disabled
+        from quixstreams import Application
+
+        # Offsets are never committed, so a replay always starts from the beginning
+        app = Application(consumer_group=self._consumer_group,
+                          auto_offset_reset="earliest" if self._replay else "latest")
+        topic = app.topic(self._topic)
+        with app.get_consumer(auto_commit_enable=False) as consumer:
+            consumer.subscribe([topic.name], on_assign=self._on_assign)
+            if not self._replay:
+                self.available = True
+            logger.info(f"Following changes on '{topic.name}'")
+            while True:
+                messages = consumer.consume(num_messages=500, timeout=0.25)
+                changes = {}
+                for msg in messages:
+                    if msg.error():
+                        logger.warning(f"Kafka error: {msg.error()}")
+                        continue
+                    try:
+                        page_id, count = self._decode(msg)
+                    except (ValueError, KeyError, TypeError, AttributeError) as e:
+                        logger.warning(f"Skipping undecodable record at {msg.topic()}[{msg.partition()}] "
+                                       f"offset {msg.offset()}: {e!r}")
+                        continue
+                    changes[page_id] = count
+                if changes:
+                    self.publish(changes)
+                if self._replay and not self.available and self._caught_up(consumer):
+                    with self._changed:
+                        self._index_pages()
+                        self._publish_snapshot()
+                    self.available = True
+                    logger.info(f"Rebuilt the counts of {len(self._counts)} pages from '{topic.name}'")
+
+    @staticmethod
+    def _decode(msg):
+        # Returns (page_id, count), with a None count for a tombstone, which only has the page id as its key
+        if msg.value() is None:
+            return msg.key().decode(), None
+        value = json.loads(msg.value())
+        return str(value['page_id']), int(value['action_count'])
+
+    def _restart(self):
+        with self._changed:
+            # A replay starts over from the beginning, and is complete once it reaches the end again
+            self._catching_up = {}
+            self._assigned = False
+            # Changes may have been missed, so every client is told to reload: none of them is at
+            # the new sequence number, and the empty log can't answer anything older
+            self._seq += 1
+            self._log.clear()
+            self._changed.notify_all()
+
+    def _on_assign(self, consumer, partitions):
+        # Remember where each partition ends at startup, the replay is complete once all are reached
+        if self._replay and not self._assigned:
+            for partition in partitions:
+                low, high = consumer.get_watermark_offsets(partition, timeout=10)
+                if high > low:
+                    self._catching_up[partition.partition] = (partition, high)
+        self._assigned = True
+
+    def _caught_up(self, consumer) -> bool:
+        if not self._assigned:
+            return False
+        if self._catching_up:
+            # The position moves past transaction markers too, unlike the offsets of the messages
+            positions = consumer.position([partition for partition, _ in self._catching_up.values()])
+            for position in positions:
+                if position.offset >= self._catching_up[position.partition][1]:
+                    del self._catching_up[position.partition]
+        return not self._catching_up
+
+    def publish(self, changes: dict):
+        # Wake up every waiting client once per batch of messages
+        with self._changed:
+            for page_id, count in changes.items():
+                self._seq += 1
+                if count is None:
+                    self._counts.pop(page_id, None)
+                else:
+                    self._counts[page_id] = count
+                self._log.append((self._seq, page_id))
+            # Publishing a table on every batch of a replay would be wasted work
+            if self._replay and self.available:
+                self._update_pages(changes)
+                self._publish_snapshot()
+            self._changed.notify_all()
+
+    def _update_pages(self, changes: dict):
+        if any(page_id not in self._page_index or count is None for page_id, count in changes.items()):
+            # New and deleted pages are rare once the replay is done, only then is the order rebuilt
+            self._index_pages()
+            return
+        for page_id, count in changes.items():
+            self._page_counts[self._page_index[page_id]] = count
+
+    def _index_pages(self):
+        self._page_ids = sorted(self._counts)
+        self._page_index = {page_id: i for i, page_id in enumerate(self._page_ids)}
+        self._page_counts = np.array([self._counts[page_id] for page_id in self._page_ids], np.int32)
+        self._page_id_array = pa.array(self._page_ids, pa.string())
+
+    def _publish_snapshot(self):
+        with self._changed:
+            # In page_id order like a plain GET /events, so that request can be answered with the table as is.
+            # The counts are copied since the array keeps being updated, the page ids are shared until new ones come
+            self.snapshot = pa.table({
+                "page_id": self._page_id_array,
+                "count": pa.array(self._page_counts.copy()),
+            })
+
+    def counts(self):
+        """
+        Return `(seq, counts)` with the latest count of every page changed since
+        the feed started, all changes up to `seq` included.
+        """
+        with self._changed:
+            return self._seq, dict(self._counts)
+
+    def wait(self, since: int, timeout: float = feed_timeout) -> int:
+        """
+        Wait up to `timeout` seconds for a change after `since`, return the latest sequence number.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._seq != since, timeout=timeout)
+            return self._seq
+
+    def wait_for_changes(self, since: int, timeout: float = feed_timeout):
+        """
+        Wait up to `timeout` seconds for a change after `since`, then return
+        `(seq, changes)` with the latest count of every page changed since, or
+        `(seq, None)` when `since` is too old to be answered.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._seq != since, timeout=timeout)
+            return self._changes_since(since)
+
+    def _changes_since(self, since: int):
+        if since == self._seq:
+            return self._seq, {}
+        # Also covers clients coming from before a restart of the gateway
+        if since > self._seq or not self._log or since < self._log[0][0] - 1:
+            return self._seq, None
+
+        page_ids = set()
+        for seq, page_id in reversed(self._log):
+            if seq <= since:
+                break
+            page_ids.add(page_id)
+        # Deleted pages have a None count
+        return self._seq, {page_id: self._counts.get(page_id) for page_id in page_ids}
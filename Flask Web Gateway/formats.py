@@ -0,0 +1,45 @@
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from query import QueryError
+
+JSON = "application/json"
+ARROW = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+
+# Values of the `format` query parameter and the media types they stand for
+FORMATS = {"json": JSON, "arrow": ARROW, "parquet": PARQUET}
+
+
+def negotiate(request) -> str:
+    """
+    Pick the response media type from the `format` parameter, or else the Accept header.
+    """
+    if "format" in request.args:
+        if request.args["format"] not in FORMATS:
+            raise QueryError(f"Unknown format '{request.args['format']}', expected one of {list(FORMATS)}")
+        return FORMATS[request.args["format"]]
+    return request.accept_mimetypes.best_match([JSON, ARROW, PARQUET], default=JSON)
+
+
+def serialize(table: pa.Table, mimetype: str, dumps) -> bytes:
+    """
+    Encode an Arrow table as JSON records, an Arrow IPC stream or a Parquet file.
+
+    Args:
+        - table: query result, as returned by DuckDB
+        - mimetype: one of the media types in FORMATS
+        - dumps: JSON encoder used for the JSON format
+    """
+    if mimetype == ARROW:
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    if mimetype == PARQUET:
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer)
+        return buffer.getvalue()
+    return dumps(table.to_pylist()).encode()
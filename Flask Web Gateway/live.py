@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import feed
+
+logger = logging.getLogger(__name__)
+
+live_port = int(os.getenv("live_port", "8081"))
+# Connections beyond this are answered with a 503, a guard against running out of file descriptors
+max_live_clients = int(os.getenv("max_live_clients", "10000"))
+
+
+class LiveServer(threading.Thread):
+    """
+    Serves the live endpoints, /events/stream and /events/changes, to any number of clients.
+
+    Each open stream or pending long-poll is a coroutine on a single asyncio event
+    loop rather than a request thread, so live clients never take threads from the
+    other requests. One thread follows the change feed and wakes all of them at
+    once per batch of changes. Clients waiting on the same sequence number share
+    the same encoded payload, so a batch is rendered once however many are
+    subscribed. The snapshot that starts a stream is loaded with `snapshot()`, which
+    returns `(seq, records)`, on the loop's worker threads.
+    """
+
+    def __init__(self, change_feed: feed.ChangeFeed, snapshot, dumps=json.dumps, host: str = "0.0.0.0",
+                 port: int = live_port, max_clients: int = max_live_clients, timeout: float = feed.feed_timeout):
+        super().__init__(name="live-server", daemon=True)
+        self._feed = change_feed
+        self._snapshot = snapshot
+        self._dumps = dumps
+        self._host = host
+        self.port = port
+        self._max_clients = max_clients
+        self._timeout = timeout
+        self._clients = 0
+        self._loop = asyncio.new_event_loop()
+        self._changed = asyncio.Event()
+        self._rendered = (None, {})  # (seq, {since: payload}) of the latest batch
+        self._listening = threading.Event()
+
+    def run(self):
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, self._host, self.port))
+        # With port 0 the system picks one
+        self.port = server.sockets[0].getsockname()[1]
+        threading.Thread(target=self._follow, name="live-follower", daemon=True).start()
+        logger.info(f"Serving live clients on port {self.port}")
+        self._listening.set()
+        self._loop.run_forever()
+
+    def wait_started(self, timeout: float = None):
+        return self._listening.wait(timeout)
+
+    def _follow(self):
+        # The only thread blocking on the feed, it wakes every client coroutine once per batch
+        seq = self._feed.seq
+        while True:
+            current = self._feed.wait(seq)
+            if current != seq:
+                seq = current
+                self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self._timeout)
+            method, target, _ = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ", 2)
+            url = urlsplit(target)
+            args = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            if method != "GET" or url.path not in ("/events/stream", "/events/changes"):
+                await self._respond(writer, 404, {"error": "not found"})
+            elif not self._feed.available:
+                await self._respond(writer, 503, {"error": "change feed is not available"})
+            elif self._clients >= self._max_clients:
+                await self._respond(writer, 503, {"error": "too many live clients"})
+            else:
+                self._clients += 1
+                try:
+                    if url.path == "/events/stream":
+                        await self._stream(writer)
+                    else:
+                        await self._changes(writer, args)
+                finally:
+                    self._clients -= 1
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError,
+                ConnectionError):
+            pass  # the client went away or didn't send a request
+        except Exception:
+            logger.exception("Live client failed")
+        finally:
+            writer.close()
+
+    async def _stream(self, writer):
+        writer.write(self._head(200, "text/event-stream", {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}))
+        seq = await self._send_snapshot(writer)
+        while True:
+            changed = self._changed
+            seq, payload = self._payload(seq)
+            if payload is None:
+                # Fell behind the change log, start again from a full snapshot
+                seq = await self._send_snapshot(writer)
+                continue
+            if payload:
+                writer.write(payload)
+                await writer.drain()
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), self._timeout)
+            except asyncio.TimeoutError:
+                writer.write(b": keep-alive\n\n")
+                await writer.drain()
+
+    async def _send_snapshot(self, writer):
+        seq, records = await self._loop.run_in_executor(None, self._snapshot)
+        writer.write(self._sse("snapshot", records, seq))
+        await writer.drain()
+        return seq
+
+    async def _changes(self, writer, args):
+        try:
+            since = int(args["since"]) if "since" in args else None
+        except ValueError:
+            await self._respond(writer, 400, {"error": "'since' must be an integer"})
+            return
+        if since is None:
+            await self._respond(writer, 200, {"seq": self._feed.seq, "changes": []})
+            return
+
+        changed = self._changed
+        seq, changes = self._feed.wait_for_changes(since, timeout=0)
+        if changes == {}:
+            try:
+                await asyncio.wait_for(changed.wait(), self._timeout)
+            except asyncio.TimeoutError:
+                pass
+            seq, changes = self._feed.wait_for_changes(since, timeout=0)
+        if changes is None:
+            await self._respond(writer, 200, {"seq": seq, "reset": True})
+        else:
+            await self._respond(writer, 200, {"seq": seq, "changes": changes_to_records(changes)})
+
+    def _payload(self, since: int):
+        """
+        Return `(seq, payload)` with the SSE event of the changes after `since`, shared by
+        every client at `since`. The payload is empty without changes, and None when
+        `since` is too old.
+        """
+        seq, rendered = self._rendered
+        if seq == self._feed.seq and since in rendered:
+            return seq, rendered[since]
+        seq, changes = self._feed.wait_for_changes(since, timeout=0)
+        if changes is None:
+            return seq, None
+        payload = self._sse("changes", changes_to_records(changes), seq) if changes else b""
+        if self._rendered[0] != seq:
+            self._rendered = (seq, {})
+        self._rendered[1][since] = payload
+        return seq, payload
+
+    def _sse(self, event, data, seq):
+        return f"event: {event}\nid: {seq}\ndata: {self._dumps(data)}\n\n".encode()
+
+    def _head(self, status: int, content_type: str, headers: dict = None, length: int = None):
+        lines = [f"HTTP/1.1 {status} {_reasons.get(status, '')}", f"Content-Type: {content_type}",
+                 "Connection: close", "Access-Control-Allow-Origin: *"]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _respond(self, writer, status: int, data):
+        body = self._dumps(data).encode()
+        writer.write(self._head(status, "application/json", length=len(body)) + body)
+        await writer.drain()
+
+
+_reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 503: "Service Unavailable"}
+
+
+def changes_to_records(changes):
+    return [{"page_id": page_id, "count": count} for page_id, count in changes.items()]
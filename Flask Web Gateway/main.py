@@ -1,38 +1,132 @@
 import os
-from flask import Flask, jsonify
+from flask import Flask, jsonify, redirect, request
 from waitress import serve
-import duckdb
 import logging
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from werkzeug.datastructures import MultiDict
 
 # for local dev, load env vars from a .env file
 from dotenv import load_dotenv
 load_dotenv()
 
+import storage
+from cache import ResponseCache, cache_ttl
+from query import QueryError, build_events_query, next_cursor
+from pool import ConnectionPool, waitress_threads
+import formats
+import feed
+import live
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Replace with your MotherDuck connection string
-mdtoken = os.environ['MOTHERDUCK_TOKEN']
-mddatabase = os.environ['MOTHERDUCK_DATABASE']
+table_name = "user_events"
+
+# Establish a connection to MotherDuck, or to a local DuckDB file depending on the storage_mode,
+# and share it between the waitress threads through a pool of cursors
+pool = ConnectionPool(lambda: storage.connect(table_name))
+
+# In local mode, keep the local file refreshed in the background, from MotherDuck or,
+# offline, from the snapshot MotherDuck Write publishes
+if storage.storage_mode == "local" and storage.motherduck_sync:
+    storage.ReplicaSync(pool.connection, table_name).start()
+elif storage.storage_mode == "local" and storage.snapshot_path:
+    storage.ReplicaSync(pool.connection, table_name, snapshot=storage.snapshot_path).start()
+
+# Follow the page count changes on the processed_data topic, shared by all stream clients.
+# In memory mode it also replays the topic and serves as the table itself.
+materialized = storage.storage_mode == "memory"
+change_feed = feed.ChangeFeed(replay=materialized)
+if feed.feed_enabled or materialized:
+    change_feed.start()
+
+# Responses are shared between all clients for cache_ttl seconds
+response_cache = ResponseCache()
+
+# Public base URL of the live server, by default the host of the request on live_port
+live_url = os.getenv("live_url", "")
+
+def current_snapshot():
+    snapshot = change_feed.snapshot
+    if snapshot is None:
+        raise feed.FeedUnavailable("the page counts are still being loaded")
+    if not change_feed.available:
+        # The last snapshot stops following the topic while the feed reconnects
+        raise feed.FeedUnavailable("the change feed is reconnecting, the page counts may be stale")
+    return snapshot
+
+def query_user_events(args, mimetype=formats.JSON):
+    if materialized and not set(args) - {"format"}:
+        # The whole table in page_id order is exactly the in-memory snapshot
+        snapshot = current_snapshot()
+        return formats.serialize(snapshot, mimetype, app.json.dumps), mimetype, {"Vary": "Accept"}
+
+    # Filters, projection, ordering and pagination are all pushed down into the SQL
+    query, params, columns, order = build_events_query(args, table_name)
+
+    logger.info(f"Running query: {query} with {params}")
+
+    # Execute the query, keeping the result in DuckDB's Arrow format
+    with pool.cursor() as cur:
+        if materialized:
+            # Zero-copy view over the current in-memory snapshot
+            cur.register(table_name, current_snapshot())
+        results = cur.execute(query, params).fetch_arrow_table()
+
+    # Point the client at the next page when this one is full
+    headers = {"Vary": "Accept"}
+    limit = args.get("limit")
+    if limit is not None and results.num_rows == int(limit):
+        headers["X-Next-After"] = next_cursor(results.slice(results.num_rows - 1).to_pylist()[0], order)
 
-# Establish a connection to MotherDuck
-conn = duckdb.connect(f'md:{mddatabase}?motherduck_token={mdtoken}')
+    # Encode the requested columns straight from Arrow
+    return formats.serialize(results.select(columns), mimetype, app.json.dumps), mimetype, headers
 
 @app.route('/events', methods=['GET'])
 def get_user_events():
-    query = "SELECT * FROM user_events ORDER BY page_id ASC"
+    try:
+        mimetype = formats.negotiate(request)
+        cached = response_cache.get((mimetype, request.full_path), lambda: query_user_events(request.args, mimetype))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except feed.FeedUnavailable as e:
+        return jsonify({"error": str(e)}), 503
 
-    logger.info(f"Running query: {query}")
+    response = app.response_class(cached.body, mimetype=cached.mimetype, headers=cached.headers)
+    response.set_etag(cached.etag)
+    response.cache_control.max_age = int(cache_ttl)
+    # Answers with a 304 and no body when the client already has this ETag
+    return response.make_conditional(request)
 
-    # Execute the query
-    results = conn.execute(query).fetchdf()
+def snapshot_records():
+    """
+    Return `(seq, records)` with the whole table, including every change up to `seq`.
+    """
+    # Shares the cache entry of a plain GET /events, which can trail the feed by up to cache_ttl,
+    # and the database itself can trail the topic, so the counts the feed has seen are laid over it
+    cached = response_cache.get((formats.JSON, "/events?"), lambda: query_user_events(MultiDict()))
+    counts = {record["page_id"]: record["count"] for record in app.json.loads(cached.body)}
+    seq, changes = change_feed.counts()
+    counts.update(changes)
+    return seq, live.changes_to_records(dict(sorted(counts.items())))
 
-    # Convert the result to a list of dictionaries
-    results_list = results.to_dict(orient='records')
+@app.route('/events/stream', methods=['GET'])
+@app.route('/events/changes', methods=['GET'])
+def redirect_live():
+    """
+    Send live clients to the live server, which holds them without taking a waitress thread.
+    """
+    base = live_url or f"{request.scheme}://{request.host.rsplit(':', 1)[0]}:{live.live_port}"
+    return redirect(f"{base.rstrip('/')}{request.full_path.rstrip('?')}", code=307)
 
-    return jsonify(results_list)
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return app.response_class(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
 if __name__ == '__main__':
-    serve(app, host="0.0.0.0", port=80)
+    # Streams and long-polls are served from an event loop, separately from the waitress threads
+    if feed.feed_enabled or materialized:
+        live.LiveServer(change_feed, snapshot_records, dumps=app.json.dumps).start()
+    serve(app, host="0.0.0.0", port=int(os.getenv("port", "80")), threads=waitress_threads)
@@ -0,0 +1,90 @@
+import duckdb
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+waitress_threads = int(os.getenv("waitress_threads", "8"))
+pool_size = int(os.getenv("pool_size", str(waitress_threads)))  # one cursor per waitress thread by default
+health_check_interval = float(os.getenv("pool_health_check_interval", "30"))
+
+pool_wait = Histogram(
+    "gateway_pool_wait_seconds", "Time spent waiting for a free database cursor",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+pool_in_use = Gauge("gateway_pool_in_use", "Number of database cursors currently checked out")
+pool_reconnects = Counter("gateway_pool_reconnects", "Number of database cursors replaced after a failure")
+
+
+class PooledCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.last_checked = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Hands out DuckDB cursors to request threads, one at a time.
+
+    A DuckDB connection must not be used by several threads at once, so the pool
+    keeps `size` cursors of the same database, each one an independent connection
+    that a single request thread borrows with `with pool.cursor() as cur:`.
+    Cursors idle for longer than `health_check_interval` are checked before they
+    are handed out, and cursors that fail are replaced with fresh ones,
+    reconnecting to the database if needed.
+    """
+
+    def __init__(self, connect, size: int = pool_size, health_check_interval: float = health_check_interval):
+        self._connect = connect
+        self._health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        self.connection = connect()
+        self._idle = queue.LifoQueue()  # reuse the most recently used, warmest cursors first
+        for _ in range(size):
+            self._idle.put(PooledCursor(self.connection.cursor()))
+
+    @contextmanager
+    def cursor(self):
+        started = time.monotonic()
+        pooled = self._idle.get()
+        pool_wait.observe(time.monotonic() - started)
+        pool_in_use.inc()
+        try:
+            if time.monotonic() - pooled.last_checked > self._health_check_interval:
+                pooled = self._check(pooled)
+            yield pooled.cursor
+        except duckdb.OperationalError:
+            # Covers lost connections and IO errors, the cursor is not trusted anymore
+            pooled = self._replace(pooled)
+            raise
+        finally:
+            pool_in_use.dec()
+            self._idle.put(pooled)
+
+    def _check(self, pooled: PooledCursor):
+        try:
+            pooled.cursor.execute("SELECT 1").fetchone()
+            pooled.last_checked = time.monotonic()
+            return pooled
+        except duckdb.Error:
+            logger.warning("Pooled cursor failed its health check, reconnecting")
+            return self._replace(pooled)
+
+    def _replace(self, pooled: PooledCursor):
+        pool_reconnects.inc()
+        try:
+            pooled.cursor.close()
+        except duckdb.Error:
+            pass
+        with self._lock:
+            try:
+                return PooledCursor(self.connection.cursor())
+            except duckdb.Error:
+                logger.exception("Database connection lost, reconnecting")
+                self.connection = self._connect()
+                return PooledCursor(self.connection.cursor())
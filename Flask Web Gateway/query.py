@@ -0,0 +1,122 @@
+import os
+
+# Columns of the page counts table that clients may select, filter and order by
+COLUMNS = ("page_id", "count")
+
+max_page_size = int(os.getenv("max_page_size", "10000"))
+
+
+class QueryError(ValueError):
+    """
+    Raised when the request asks for something the events query can't do.
+    """
+
+
+def parse_columns(args):
+    if not args.get("columns"):
+        return list(COLUMNS)
+    columns = [column.strip() for column in args["columns"].split(",") if column.strip()]
+    unknown = [column for column in columns if column not in COLUMNS]
+    if unknown or not columns:
+        raise QueryError(f"Unknown columns {unknown}, expected a subset of {list(COLUMNS)}")
+    return columns
+
+
+def parse_order(args):
+    order = args.get("order", "page_id")
+    descending = order.startswith("-")
+    order = order.lstrip("-")
+    if order not in COLUMNS:
+        raise QueryError(f"Cannot order by '{order}', expected one of {list(COLUMNS)} optionally prefixed with '-'")
+    return order, descending
+
+
+def parse_int(args, name, minimum=None):
+    if args.get(name) is None:
+        return None
+    try:
+        value = int(args[name])
+    except ValueError:
+        raise QueryError(f"'{name}' must be an integer")
+    if minimum is not None and value < minimum:
+        raise QueryError(f"'{name}' must be at least {minimum}")
+    return value
+
+
+def build_events_query(args, table_name: str):
+    """
+    Translate the /events query string into a parameterized DuckDB query.
+
+    Supported parameters:
+        - columns: comma separated list of the columns to return
+        - page_id: only return these pages, repeated or comma separated
+        - page_id_prefix: only return pages whose id starts with this prefix
+        - min_count: only return pages with at least this count
+        - order: column to order by, prefixed with '-' for descending order
+        - limit: maximum number of rows to return
+        - after: cursor returned by the previous page, to continue from
+
+    Returns:
+        - (sql, params, columns, order) where `columns` are the requested columns;
+          the query may select the order keys as well, to build the next cursor
+    """
+    columns = parse_columns(args)
+    order, descending = parse_order(args)
+    limit = parse_int(args, "limit", minimum=1)
+    min_count = parse_int(args, "min_count")
+    if limit is not None and limit > max_page_size:
+        raise QueryError(f"'limit' must be at most {max_page_size}")
+
+    conditions = []
+    params = []
+
+    page_ids = [page_id for value in args.getlist("page_id") for page_id in value.split(",") if page_id]
+    if page_ids:
+        conditions.append("page_id IN (SELECT unnest(?))")
+        params.append(page_ids)
+    if args.get("page_id_prefix"):
+        conditions.append("starts_with(page_id, ?)")
+        params.append(args["page_id_prefix"])
+    if min_count is not None:
+        conditions.append('"count" >= ?')
+        params.append(min_count)
+
+    # Keyset pagination: continue right after the last row of the previous page.
+    # page_id is unique, so it breaks ties when ordering by count.
+    comparison = "<" if descending else ">"
+    if args.get("after"):
+        if order == "page_id":
+            conditions.append(f"page_id {comparison} ?")
+            params.append(args["after"])
+        else:
+            last_count, _, last_page_id = args["after"].partition(":")
+            try:
+                last_count = int(last_count)
+            except ValueError:
+                raise QueryError("'after' must be a cursor returned by the previous page")
+            conditions.append(f'("count" {comparison} ? OR ("count" = ? AND page_id {comparison} ?))')
+            params += [last_count, last_count, last_page_id]
+
+    direction = "DESC" if descending else "ASC"
+    keys = ["page_id"] if order == "page_id" else ["count", "page_id"]
+    selected = columns + [key for key in keys if key not in columns]
+
+    select_list = ", ".join(f'"{column}"' for column in selected)
+    sql = f'SELECT {select_list} FROM "{table_name}"'
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY " + ", ".join(f'"{key}" {direction}' for key in keys)
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    return sql, params, columns, order
+
+
+def next_cursor(last_row: dict, order: str):
+    """
+    Build the `after` cursor pointing right after `last_row`.
+    """
+    if order == "page_id":
+        return str(last_row["page_id"])
+    return f'{last_row["count"]}:{last_row["page_id"]}'
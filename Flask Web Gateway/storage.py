@@ -0,0 +1,182 @@
+import duckdb
+import logging
+import os
+import re
+import threading
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+# Where the gateway reads from:
+#   motherduck - query MotherDuck directly (default)
+#   local      - query a local DuckDB file that is refreshed from MotherDuck in the background,
+#                or, when motherduck_sync is disabled, from the snapshot published by MotherDuck Write
+#   memory     - query the latest counts kept in memory from the processed_data topic,
+#                without any database behind the gateway
+storage_mode = os.getenv("storage_mode", "motherduck")
+local_db_path = os.getenv("local_db_path", "user_events.duckdb")
+motherduck_sync = os.getenv("motherduck_sync", "true").lower() == "true"
+sync_interval = float(os.getenv("sync_interval", "5.0"))
+# Seconds of changes read again from MotherDuck each round, for writers committing out of order
+sync_lookback = float(os.getenv("sync_lookback", "30.0"))
+# Directory of the table changes published by MotherDuck Write, whose own file can't be opened while it writes
+snapshot_path = os.getenv("snapshot_path", "")
+
+_snapshot_file = re.compile(r"^(\d{12})(-full)?\.parquet$")
+
+
+def motherduck_connect():
+    # Replace with your MotherDuck connection string
+    mdtoken = os.environ['MOTHERDUCK_TOKEN']
+    mddatabase = os.environ['MOTHERDUCK_DATABASE']
+    return duckdb.connect(f'md:{mddatabase}?motherduck_token={mdtoken}')
+
+
+def connect(tablename: str):
+    """
+    Open the connection queries are served from, according to `storage_mode`.
+    """
+    if storage_mode == "motherduck":
+        return motherduck_connect()
+    if storage_mode == "local":
+        logger.info(f"Reading from local DuckDB file '{local_db_path}'")
+        conn = duckdb.connect(local_db_path)
+        # Make sure an empty table is there to query before the first sync
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS "{tablename}" (
+                page_id VARCHAR UNIQUE,
+                count INTEGER,
+                updated_at TIMESTAMPTZ
+            );
+        ''')
+        return conn
+    if storage_mode == "memory":
+        # The table is registered on each cursor from the in-memory snapshot
+        return duckdb.connect(":memory:")
+    raise ValueError(f"Unknown storage_mode '{storage_mode}', expected 'motherduck', 'local' or 'memory'")
+
+
+def snapshot_files(path: str):
+    """
+    List the files published by MotherDuck Write in `path` as (seq, is_full, path), in publishing order.
+    """
+    files = []
+    for name in os.listdir(path):
+        match = _snapshot_file.match(name)
+        if match:
+            files.append((int(match.group(1)), match.group(2) is not None, os.path.join(path, name)))
+    return sorted(files)
+
+
+class ReplicaSync(threading.Thread):
+    """
+    Keeps a table in the local DuckDB file up to date with its MotherDuck copy.
+
+    The first round loads the whole table. After that, every `interval` seconds
+    only the rows whose `updated_at` is past the latest one already loaded are
+    read from MotherDuck, going back `lookback` seconds for writers that commit
+    out of order, and upserted into the local file in a single transaction. Readers
+    always see a consistent table and never wait on MotherDuck themselves.
+
+    With a `snapshot`, the changes are read from that directory instead, as
+    published by MotherDuck Write, and MotherDuck is never contacted: the change
+    files newer than the last one applied are upserted in order, and the latest
+    full file is loaded first on the first round or when files were missed.
+    """
+
+    def __init__(self, conn, tablename: str, interval: float = sync_interval, snapshot: str = None,
+                 lookback: float = sync_lookback):
+        super().__init__(name="motherduck-replica", daemon=True)
+        self._local = conn.cursor()  # DuckDB connections must not be shared between threads
+        self._remote = None
+        self._tablename = tablename
+        self._interval = interval
+        self._snapshot = snapshot
+        self._lookback = timedelta(seconds=lookback)
+        self._watermark = None  # latest updated_at loaded from MotherDuck
+        self._applied = None  # seq of the last snapshot file applied
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.sync()
+            self._stopped.wait(self._interval)
+
+    def sync(self):
+        try:
+            if self._snapshot is not None:
+                self._sync_snapshot()
+            else:
+                self._sync_motherduck()
+        except Exception:
+            logger.exception(f"Failed to refresh from {self._snapshot or 'MotherDuck'}, serving the previous snapshot")
+            self._remote = None  # reconnect on the next round
+
+    def _sync_motherduck(self):
+        if self._remote is None:
+            self._remote = motherduck_connect()
+        query = f'SELECT page_id, count, updated_at FROM "{self._tablename}"'
+        if self._watermark is None:
+            frame = self._remote.execute(query).fetchdf()
+        else:
+            frame = self._remote.execute(f"{query} WHERE updated_at >= ?",
+                                         [self._watermark - self._lookback]).fetchdf()
+
+        self._local.register("replica_frame", frame)
+        try:
+            self._apply([("replica_frame", self._watermark is None)])
+        finally:
+            self._local.unregister("replica_frame")
+        if frame["updated_at"].notna().any():
+            self._watermark = frame["updated_at"].max().to_pydatetime()
+        logger.info(f"Refreshed {len(frame)} rows from MotherDuck")
+
+    def _sync_snapshot(self):
+        files = snapshot_files(self._snapshot) if os.path.isdir(self._snapshot) else []
+        if not files:
+            logger.info(f"Waiting for the snapshot '{self._snapshot}' to be published")
+            return
+        pending = [file for file in files if self._applied is None or file[0] > self._applied]
+        if self._applied is not None and not pending and files[-1][0] >= self._applied:
+            return
+
+        # Start again from the latest full file on the first round, when the writer started
+        # over, or when files were removed before they were applied
+        if self._applied is None or not pending or pending[0][0] != self._applied + 1:
+            fulls = [i for i, (_, is_full, _) in enumerate(files) if is_full]
+            if not fulls:
+                logger.info(f"Waiting for a full snapshot in '{self._snapshot}'")
+                return
+            pending = files[fulls[-1]:]
+
+        self._apply([(f"read_parquet('{path}')", i == 0 and is_full)
+                     for i, (_, is_full, path) in enumerate(pending)])
+        self._applied = pending[-1][0]
+        logger.info(f"Applied {len(pending)} snapshot files from '{self._snapshot}'")
+
+    def _apply(self, sources):
+        # Each source is (relation, replace), upserted in order in one transaction
+        try:
+            self._local.execute("BEGIN TRANSACTION")
+            for relation, replace in sources:
+                if replace:
+                    self._local.execute(f'''
+                        CREATE OR REPLACE TABLE "{self._tablename}" (
+                            page_id VARCHAR UNIQUE,
+                            count INTEGER,
+                            updated_at TIMESTAMPTZ
+                        );
+                    ''')
+                self._local.execute(f'''
+                    INSERT INTO "{self._tablename}" (page_id, count, updated_at)
+                    SELECT page_id, count, updated_at FROM {relation}
+                    ON CONFLICT (page_id) DO UPDATE SET count = excluded.count, updated_at = excluded.updated_at
+                ''')
+            self._local.execute("COMMIT")
+        except Exception:
+            self._local.execute("ROLLBACK")
+            raise
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
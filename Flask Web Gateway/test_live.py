@@ -0,0 +1,91 @@
+import json
+import socket
+import threading
+
+import feed
+import live
+
+SUBSCRIBERS = 16  # well past the waitress thread pool and the former cap of 4
+
+
+def start_server(change_feed):
+    server = live.LiveServer(change_feed, lambda: (change_feed.seq, []), host="127.0.0.1", port=0, timeout=5)
+    server.start()
+    assert server.wait_started(5)
+    return server
+
+
+def request(server, path):
+    sock = socket.create_connection(("127.0.0.1", server.port), timeout=5)
+    sock.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    return sock
+
+
+def read_event(sock, buffer):
+    # Returns the next SSE event as (event, data) and what was read past it
+    while b"\n\n" not in buffer or buffer.startswith(b":"):
+        if buffer.startswith(b":") and b"\n\n" in buffer:
+            buffer = buffer.split(b"\n\n", 1)[1]
+            continue
+        chunk = sock.recv(65536)
+        assert chunk, "stream closed"
+        buffer += chunk
+    block, rest = buffer.split(b"\n\n", 1)
+    fields = dict(line.split(": ", 1) for line in block.decode().splitlines())
+    return (fields["event"], json.loads(fields["data"])), rest
+
+
+def open_stream(server):
+    sock = request(server, "/events/stream")
+    buffer = b""
+    while b"\r\n\r\n" not in buffer:
+        buffer += sock.recv(65536)
+    head, buffer = buffer.split(b"\r\n\r\n", 1)
+    assert head.startswith(b"HTTP/1.1 200")
+    return sock, buffer
+
+
+def test_stream_serves_more_subscribers_than_threads():
+    change_feed = feed.ChangeFeed()
+    change_feed.available = True
+    server = start_server(change_feed)
+
+    streams = [open_stream(server) for _ in range(SUBSCRIBERS)]
+    for i, (sock, buffer) in enumerate(streams):
+        (event, data), buffer = read_event(sock, buffer)
+        assert (event, data) == ("snapshot", [])
+        streams[i] = (sock, buffer)
+
+    change_feed.publish({"page_1": 3})
+    for sock, buffer in streams:
+        (event, data), _ = read_event(sock, buffer)
+        assert (event, data) == ("changes", [{"page_id": "page_1", "count": 3}])
+        sock.close()
+
+
+def test_long_poll_serves_more_subscribers_than_threads():
+    change_feed = feed.ChangeFeed()
+    change_feed.available = True
+    server = start_server(change_feed)
+
+    responses = [None] * SUBSCRIBERS
+
+    def poll(i):
+        sock = request(server, f"/events/changes?since={change_feed.seq}")
+        body = b""
+        while chunk := sock.recv(65536):
+            body += chunk
+        sock.close()
+        responses[i] = json.loads(body.split(b"\r\n\r\n", 1)[1])
+
+    pollers = [threading.Thread(target=poll, args=(i,)) for i in range(SUBSCRIBERS)]
+    for poller in pollers:
+        poller.start()
+    # All of them are pending at once before anything changes
+    while server._clients < SUBSCRIBERS:
+        threading.Event().wait(0.01)
+    change_feed.publish({"page_2": 7})
+    for poller in pollers:
+        poller.join(5)
+
+    assert responses == [{"seq": 1, "changes": [{"page_id": "page_2", "count": 7}]}] * SUBSCRIBERS
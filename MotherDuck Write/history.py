@@ -0,0 +1,207 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+from quixstreams.sinks import SinkBatch
+
+logger = logging.getLogger(__name__)
+
+# Optional append-only history of every count update
+history_enabled = os.getenv("history_enabled", "false").lower() == "true"
+history_bucket = os.getenv("history_bucket", "hour")  # size of the time buckets: minute, hour or day
+history_parquet_path = os.getenv("history_parquet_path", "history")  # where closed buckets are compacted to
+history_compact_interval = float(os.getenv("history_compact_interval", "3600"))
+
+BUCKETS = ("minute", "hour", "day")
+
+
+class HistoryWriter:
+    """
+    Appends every page count update to a history table, bucketed by time.
+
+    Rows are only ever appended, in time order, so each bucket occupies a
+    contiguous range of the table and DuckDB can skip the row groups outside of a
+    queried time range. The last offset appended from each partition is stored
+    with the rows, so a batch consumed again after a failed checkpoint only
+    appends the records that are not in the table yet.
+
+    The connection is given on every call, so it follows the sink's when it reconnects.
+    """
+
+    def __init__(self, tablename: str, bucket: str = history_bucket):
+        if bucket not in BUCKETS:
+            raise ValueError(f"Unknown history_bucket '{bucket}', expected one of {BUCKETS}")
+        self.tablename = f"{tablename}_history"
+        self.offsets_tablename = f"{tablename}_history_offsets"
+        self.bucket = bucket
+
+    def create_tables(self, con):
+        con.execute(f'''
+            CREATE TABLE IF NOT EXISTS "{self.tablename}" (
+                page_id VARCHAR,
+                count INTEGER,
+                ts TIMESTAMP,
+                bucket TIMESTAMP
+            );
+        ''')
+        con.execute(f'''
+            CREATE TABLE IF NOT EXISTS "{self.offsets_tablename}" (
+                topic VARCHAR,
+                partition INTEGER,
+                "offset" BIGINT,
+                PRIMARY KEY (topic, partition)
+            );
+        ''')
+
+    def append(self, con, batch: SinkBatch):
+        frame = pd.DataFrame({
+            "page_id": [item.value['page_id'] for item in batch],
+            "count": [item.value['action_count'] for item in batch],
+            "ts": pd.to_datetime([item.timestamp for item in batch], unit="ms"),
+            "offset": [item.offset for item in batch],
+        })
+
+        con.register("history_batch", frame)
+        try:
+            con.execute("BEGIN TRANSACTION")
+            con.execute(f'''
+                INSERT INTO "{self.tablename}" (page_id, count, ts, bucket)
+                SELECT page_id, count, ts, date_trunc('{self.bucket}', ts)
+                FROM history_batch
+                WHERE "offset" > coalesce(
+                    (SELECT "offset" FROM "{self.offsets_tablename}" WHERE topic = ? AND partition = ?), -1)
+                ORDER BY ts;
+                ''', [batch.topic, batch.partition])
+            con.execute(f'''
+                INSERT INTO "{self.offsets_tablename}" (topic, partition, "offset") VALUES (?, ?, ?)
+                ON CONFLICT (topic, partition) DO UPDATE SET "offset" = greatest("offset", excluded."offset");
+                ''', [batch.topic, batch.partition, int(frame["offset"].max())])
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        finally:
+            con.unregister("history_batch")
+
+
+class HistoryCompactor(threading.Thread):
+    """
+    Every `interval` seconds, moves the closed buckets of the history table into
+    Parquet files partitioned by date and page, which `rollup()` reads alongside
+    the rows still in the table.
+
+    The Parquet files are written to the local disk, so this only runs next to a
+    local DuckDB file. In MotherDuck the history stays in the table.
+    """
+
+    def __init__(self, con, tablename: str, bucket: str = history_bucket,
+                 parquet_path: str = history_parquet_path, interval: float = history_compact_interval):
+        super().__init__(name="history-compactor", daemon=True)
+        self._con = con.cursor()  # DuckDB connections must not be shared between threads
+        self.tablename = f"{tablename}_history"
+        self.bucket = bucket
+        self.parquet_path = parquet_path
+        self._interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.compact()
+            except Exception:
+                # The rows stay in the table and are moved on the next round
+                logger.exception("Failed to compact the history")
+
+    def compact(self):
+        """
+        Move every closed bucket from the history table into Parquet files.
+        """
+        # Kafka timestamps are stored as UTC, so the current bucket is taken in UTC too
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        cutoff = self._con.execute(f"SELECT date_trunc('{self.bucket}', ?::TIMESTAMP)", [now]).fetchone()[0]
+
+        started = time.monotonic()
+        self._con.execute("BEGIN TRANSACTION")
+        try:
+            moved = self._con.execute(
+                f'SELECT count(*) FROM "{self.tablename}" WHERE bucket < ?', [cutoff]).fetchone()[0]
+            if moved:
+                self._con.execute(f'''
+                    COPY (
+                        SELECT page_id, count, ts, bucket, CAST(bucket AS DATE) AS date
+                        FROM "{self.tablename}"
+                        WHERE bucket < ?
+                        ORDER BY ts
+                    ) TO '{self.parquet_path}'
+                    (FORMAT PARQUET, PARTITION_BY (date, page_id), OVERWRITE_OR_IGNORE, FILENAME_PATTERN 'part_{{uuid}}');
+                    ''', [cutoff])
+                self._con.execute(f'DELETE FROM "{self.tablename}" WHERE bucket < ?', [cutoff])
+            self._con.execute("COMMIT")
+        except Exception:
+            self._con.execute("ROLLBACK")
+            raise
+        logger.info(f"Compacted {moved} history rows older than {cutoff} to '{self.parquet_path}' "
+                    f"in {time.monotonic() - started:.3f}s")
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def rollup(con, start, end, granularity: str = "hour", page_ids=None,
+           tablename: str = "user_events_history", parquet_path: str = history_parquet_path):
+    """
+    Summarise the page count history between `start` (inclusive) and `end` (exclusive).
+
+    Only the Parquet partitions for the dates in range (and the requested pages)
+    are read, together with the rows of the history table that were not
+    compacted yet.
+
+    Args:
+        - con: DuckDB connection holding the history table
+        - start: start of the time range, as a datetime
+        - end: end of the time range, as a datetime
+        - granularity: size of the returned buckets: minute, hour or day
+        - page_ids: optional list of pages to restrict the rollup to
+        - tablename: name of the history table
+        - parquet_path: directory the history is compacted to
+
+    Returns:
+        - DataFrame with one row per bucket and page, holding the number of
+          actions in the bucket and the page's total count at the end of it
+    """
+    if granularity not in BUCKETS:
+        raise ValueError(f"Unknown granularity '{granularity}', expected one of {BUCKETS}")
+
+    page_filter = "AND page_id IN (SELECT unnest(?))" if page_ids else ""
+    page_params = [list(page_ids)] if page_ids else []
+
+    sources = [f'''
+        SELECT page_id, count, ts FROM "{tablename}"
+        WHERE ts >= ? AND ts < ? {page_filter}
+    ''']
+    params = [start, end] + page_params
+
+    parquet_glob = f"{parquet_path}/**/*.parquet"
+    if con.execute("SELECT count(*) FROM glob(?)", [parquet_glob]).fetchone()[0]:
+        # Filtering on the partition columns lets DuckDB skip the other directories
+        sources.append(f'''
+            SELECT page_id, count, ts FROM read_parquet('{parquet_glob}', hive_partitioning = true)
+            WHERE date >= CAST(? AS DATE) AND date <= CAST(? AS DATE)
+            AND ts >= ? AND ts < ? {page_filter}
+        ''')
+        params += [start, end, start, end] + page_params
+
+    query = f'''
+        SELECT date_trunc('{granularity}', ts) AS bucket,
+               page_id,
+               count(*) AS actions,
+               max(count) AS total
+        FROM ({" UNION ALL ".join(sources)})
+        GROUP BY ALL
+        ORDER BY bucket, page_id
+    '''
+    return con.execute(query, params).fetchdf()
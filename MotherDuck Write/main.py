@@ -1,4 +1,3 @@
-import duckdb
 import logging
 import os
 from quixstreams import Application
@@ -6,49 +5,99 @@ from quixstreams.kafka.configuration import ConnectionConfig
 from dotenv import load_dotenv
 
 load_dotenv() # for local dev, load env vars from a .env file
+
+from sink import MotherDuckSink
+import storage
+import history
+import metrics
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize the Quix Application with the connection configuration
+# Records are buffered and flushed to MotherDuck on every checkpoint, which is
+# triggered after flush_max_records messages or flush_interval seconds
+flush_interval = float(os.getenv("flush_interval", "1.0"))
+flush_max_records = int(os.getenv("flush_max_records", "5000"))
 app = Application(consumer_group="count-consumer-v1",
-                  auto_offset_reset="earliest")
+                  auto_offset_reset="earliest",
+                  commit_interval=flush_interval,
+                  commit_every=flush_max_records)
 
 input_topic = app.topic(os.getenv("input","processed_data")) # Define the input topic to consume from
 tablename = os.getenv("db_table_name","page_actions") # The name of the table we want to write to
 sdf = app.dataframe(input_topic) # Turn the data from the input topic into a streaming dataframe
 
-mdtoken = os.environ['MOTHERDUCK_TOKEN']
-mddatabase = os.environ['MOTHERDUCK_DATABASE']
-# initiate the MotherDuck connection through a service token through
-con = duckdb.connect(f'md:{mddatabase}?motherduck_token={mdtoken}')
+# Optionally keep the full history of the counts as well
+history_writer = history.HistoryWriter(tablename) if history.history_enabled else None
+
+def connect():
+    # Connect to MotherDuck, or to a local DuckDB file depending on the storage_mode
+    con = storage.connect()
+    storage.create_table(con, tablename)
+    if history_writer is not None:
+        history_writer.create_tables(con)
+    return con
+
+con = connect()
+
+# In local mode, push the written pages to MotherDuck in the background
+sync = None
+if storage.storage_mode == "local" and storage.motherduck_sync:
+    sync = storage.WriteBehindSync(con, tablename)
+    sync.mark_all_dirty()
+    sync.start()
+
+# In local mode, publish a copy of the table the gateway can read
+snapshot = None
+if storage.storage_mode == "local" and storage.snapshot_path:
+    snapshot = storage.SnapshotPublisher(con, tablename)
+    snapshot.start()
+
+# The closed history buckets are moved to Parquet files on the local disk, which
+# only outlives the container alongside the local DuckDB file
+compactor = None
+if history_writer is not None and storage.storage_mode == "local":
+    compactor = history.HistoryCompactor(con, tablename)
+    compactor.start()
+
+def resize_checkpoints(records: int, interval: float):
+    """
+    Apply the controller's checkpoint size to the next checkpoints.
+
+    Quix Streams has no public setter for them, but reads `commit_every` and
+    `commit_interval` from its processing context every time it starts a
+    checkpoint. This is the only place they are changed, and quixstreams is
+    pinned in requirements.txt to the version this was checked against.
+    """
+    app._processing_context.commit_every = records
+    app._processing_context.commit_interval = interval
+
+# Fail on startup rather than silently keep the initial sizes if the context changes
+if not all(hasattr(app._processing_context, name) for name in ("commit_every", "commit_interval")):
+    raise RuntimeError("This Quix Streams version can't resize checkpoints, install the one in requirements.txt")
+
+# Expose write metrics and keep the writes within the target latency
+metrics.start()
+controller = metrics.AdaptiveController(
+    target_latency=float(os.getenv("target_write_latency", "0.5")),
+    base_interval=flush_interval,
+    max_interval=float(os.getenv("max_flush_interval", "30")),
+    min_records=int(os.getenv("min_checkpoint_records", "100")),
+    max_records=flush_max_records,
+    on_resize=resize_checkpoints)
+
+# Buffer the records and write them as bulk upserts, committing offsets after each flush
+sink = MotherDuckSink(con, tablename, sync=sync, history=history_writer,
+                      controller=controller, connect=connect)
+sdf.sink(sink)
 
 try:
-    # Do a basic check if the target table exists and create it if not
-    table_exists = con.execute(
-        f"SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = '\"{tablename}\"')").fetchone()[0]
-    if not table_exists:
-        con.execute(f'''
-            CREATE TABLE "{tablename}" (
-                page_id VARCHAR UNIQUE,
-                count INTEGER
-            );
-        ''')
-except duckdb.CatalogException as e:
-     # If basic check failed, check for catalog error as a backup
-    if "already exists" in str(e):
-        print(f"Table '{tablename}' already exists, skipping creation.")
-    else:
-        raise  # Re-raise the exception if it's not about table existence
-
-def insert_data(con, msg):
-    # Insert data into the DB and if the page_id exists, update the count in the existing row
-    con.execute(f'''
-        INSERT INTO {tablename}(page_id, count) VALUES (?, ?)
-        ON CONFLICT (page_id)
-        DO UPDATE SET count = excluded.count;
-        ''', (msg['page_id'], msg['action_count']))
-    logger.info(f"Wrote record: {msg}")
-
-sdf = sdf.update(lambda val: insert_data(con, val), stateful=False)
-
-app.run(sdf)
\ No newline at end of file
+    app.run(sdf)
+finally:
+    if sync is not None:
+        sync.stop()
+    if snapshot is not None:
+        snapshot.stop()
+    if compactor is not None:
+        compactor.stop()
\ No newline at end of file
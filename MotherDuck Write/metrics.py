@@ -0,0 +1,84 @@
+import logging
+import os
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+metrics_port = int(os.getenv("metrics_port", "9100"))
+
+# Write-side metrics, scraped from http://<host>:<metrics_port>/metrics
+write_latency = Histogram(
+    "motherduck_write_latency_seconds", "Duration of a single bulk upsert",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+rows_written = Counter("motherduck_rows_written", "Number of page rows upserted")
+records_flushed = Counter("motherduck_records_flushed", "Number of Kafka records flushed")
+rows_per_second = Gauge("motherduck_rows_per_second", "Rows upserted per second over the last flush interval")
+consumer_lag = Gauge(
+    "motherduck_consumer_lag_seconds", "Age of the newest record in the last flushed batch",
+    ["partition"])
+checkpoint_records = Gauge("motherduck_checkpoint_records", "Current maximum number of records per checkpoint")
+flush_interval = Gauge("motherduck_flush_interval_seconds", "Current minimum number of seconds between flushes")
+backpressure_events = Counter("motherduck_backpressure_events", "Number of times consumption was paused")
+
+
+def start():
+    start_http_server(metrics_port)
+    logger.info(f"Serving metrics on port {metrics_port}")
+
+
+class AdaptiveController:
+    """
+    Keeps MotherDuck writes inside a target latency budget.
+
+    The time each checkpoint takes to write is reported with `observe()`. When a
+    checkpoint exceeds the budget the number of records per checkpoint is halved
+    and the flush interval is doubled, so MotherDuck gets smaller and fewer
+    transactions. While checkpoints stay well inside the budget the number of
+    records grows back by a quarter and the flush interval returns to its base
+    value. `on_resize` is called with the new number of records per checkpoint
+    and flush interval, which the application applies to its next checkpoints.
+    """
+
+    def __init__(self, target_latency: float, base_interval: float, max_interval: float,
+                 min_records: int, max_records: int, on_resize=None):
+        self.target_latency = target_latency
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.min_records = min_records
+        self.max_records = max_records
+        self._on_resize = on_resize
+
+        self.records = max_records
+        self.flush_interval = base_interval
+        self._publish()
+
+    def observe(self, latency: float, records: int):
+        resized = (self.records, self.flush_interval)
+        if latency > self.target_latency:
+            self.records = max(self.min_records, self.records // 2)
+            self.flush_interval = min(self.max_interval, self.flush_interval * 2)
+        elif latency < self.target_latency / 2:
+            # Only grow when the size limit was what ended the checkpoint
+            if records >= self.records:
+                self.records = min(self.max_records, int(self.records * 1.25) + 1)
+            self.flush_interval = max(self.base_interval, self.flush_interval / 2)
+        self._resized(resized)
+
+    def on_failure(self):
+        """
+        Back off after a failed write, returns the number of seconds to pause consumption for.
+        """
+        resized = (self.records, self.flush_interval)
+        self.flush_interval = min(self.max_interval, self.flush_interval * 2)
+        self._resized(resized)
+        return self.flush_interval
+
+    def _resized(self, previous: tuple):
+        if (self.records, self.flush_interval) != previous and self._on_resize is not None:
+            self._on_resize(self.records, self.flush_interval)
+        self._publish()
+
+    def _publish(self):
+        checkpoint_records.set(self.records)
+        flush_interval.set(self.flush_interval)
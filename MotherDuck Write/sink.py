@@ -0,0 +1,130 @@
+import duckdb
+import logging
+import time
+
+import pandas as pd
+from quixstreams.sinks import BatchingSink, SinkBackpressureError, SinkBatch
+
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+def upsert_counts(con, tablename: str, frame: pd.DataFrame):
+    """
+    Write a batch of page counts to the table as a single bulk upsert.
+
+    The frame is registered with DuckDB as a view so the rows are scanned straight
+    from its columns, and the whole batch is applied in one transaction.
+
+    Args:
+        - con: DuckDB connection (or cursor) to write with
+        - tablename: name of the target table
+        - frame: DataFrame with unique `page_id` values and their `count`
+    """
+    con.register("page_counts_batch", frame)
+    try:
+        con.execute("BEGIN TRANSACTION")
+        # updated_at lets readers fetch only the pages changed since their last read
+        con.execute(f'''
+            INSERT INTO "{tablename}" (page_id, count, updated_at)
+            SELECT page_id, count, now() FROM page_counts_batch
+            ON CONFLICT (page_id)
+            DO UPDATE SET count = excluded.count, updated_at = excluded.updated_at;
+            ''')
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.unregister("page_counts_batch")
+
+
+class MotherDuckSink(BatchingSink):
+    """
+    Buffers `processed_data` records and upserts them into MotherDuck in bulk.
+
+    Records are accumulated by the Application until the next checkpoint, which
+    happens every `commit_every` messages or `commit_interval` seconds, whichever
+    comes first. On checkpoint only the latest count per `page_id` is written,
+    and the consumer offsets are committed once the write has succeeded.
+
+    When writing to a local DuckDB file, `sync` is notified of the written pages
+    so they can be pushed to MotherDuck in the background. When `history` is set,
+    every record of the batch is also appended to the history table.
+
+    With a `controller`, the time each checkpoint takes to write is reported so
+    the controller can size the next ones, and consumption is paused while
+    MotherDuck is unreachable. After a failed write the connection is opened
+    again with `connect`.
+    """
+
+    def __init__(self, con, tablename: str, sync=None, history=None, controller=None, connect=None):
+        super().__init__()
+        self._con = con
+        self._connect = connect
+        self._tablename = tablename
+        self._sync = sync
+        self._history = history
+        self._controller = controller
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        if self._controller is None or not self._batches:
+            return super().flush()
+
+        records = sum(batch.size for batch in self._batches.values())
+        started = time.monotonic()
+        super().flush()
+        self._controller.observe(time.monotonic() - started, records)
+
+    def write(self, batch: SinkBatch):
+        # Keep the latest count for each page, later messages win
+        latest = {}
+        for item in batch:
+            latest[item.value['page_id']] = item.value['action_count']
+
+        frame = pd.DataFrame({
+            "page_id": list(latest.keys()),
+            "count": list(latest.values()),
+        })
+
+        started = time.monotonic()
+        try:
+            if self._con is None:
+                self._con = self._connect()
+            upsert_counts(self._con, self._tablename, frame)
+            if self._history is not None:
+                self._history.append(self._con, batch)
+        except duckdb.OperationalError:
+            if self._controller is None:
+                raise
+            # Upserts are idempotent and so is the history, so the whole checkpoint can safely be retried later
+            logger.exception("Write to MotherDuck failed, reconnecting and pausing consumption")
+            if self._connect is not None:
+                # Not closed, the background threads hold cursors of the local connection
+                self._con = None
+            metrics.backpressure_events.inc()
+            raise SinkBackpressureError(retry_after=self._controller.on_failure())
+        elapsed = time.monotonic() - started
+        metrics.write_latency.observe(elapsed)
+
+        # The counts of these records are now in MotherDuck (or the local file)
+        for item in batch:
+            tracing.observe("motherduck_write", item.headers)
+
+        if self._sync is not None:
+            self._sync.mark_dirty(latest.keys())
+
+        self._record_flush(batch, len(frame))
+        logger.info(f"Flushed {len(frame)} pages from {batch.size} records "
+                    f"({batch.topic}[{batch.partition}]) in {elapsed:.3f}s")
+
+    def _record_flush(self, batch: SinkBatch, rows: int):
+        since_last_flush, self._last_flush = time.monotonic() - self._last_flush, time.monotonic()
+        metrics.rows_per_second.set(rows / max(since_last_flush, 1e-3))
+        metrics.rows_written.inc(rows)
+        metrics.records_flushed.inc(batch.size)
+        newest = max(item.timestamp for item in batch)
+        metrics.consumer_lag.labels(partition=str(batch.partition)).set(max(0.0, time.time() - newest / 1000))
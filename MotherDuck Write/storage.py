@@ -0,0 +1,244 @@
+import duckdb
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timezone
+
+from sink import upsert_counts
+
+logger = logging.getLogger(__name__)
+
+# Where the sink writes to:
+#   motherduck - write straight to MotherDuck (default)
+#   local      - write to a local DuckDB file and sync it to MotherDuck in the background,
+#                or run fully offline when motherduck_sync is disabled
+storage_mode = os.getenv("storage_mode", "motherduck")
+local_db_path = os.getenv("local_db_path", "user_events.duckdb")
+motherduck_sync = os.getenv("motherduck_sync", "true").lower() == "true"
+sync_interval = float(os.getenv("sync_interval", "5.0"))
+sync_batch_size = int(os.getenv("sync_batch_size", "10000"))
+# In local mode, where to publish a read-only copy of the table for other processes such as the gateway
+snapshot_path = os.getenv("snapshot_path", "")
+# Every how many change files the whole table is published again
+snapshot_full_every = int(os.getenv("snapshot_full_every", "720"))
+
+_snapshot_file = re.compile(r"^(\d{12})(-full)?\.parquet$")
+
+
+def motherduck_connect():
+    # initiate the MotherDuck connection through a service token
+    mdtoken = os.environ['MOTHERDUCK_TOKEN']
+    mddatabase = os.environ['MOTHERDUCK_DATABASE']
+    return duckdb.connect(f'md:{mddatabase}?motherduck_token={mdtoken}')
+
+
+def connect():
+    """
+    Open the connection the sink writes to, according to `storage_mode`.
+    """
+    if storage_mode == "motherduck":
+        return motherduck_connect()
+    if storage_mode == "local":
+        logger.info(f"Writing to local DuckDB file '{local_db_path}'")
+        return duckdb.connect(local_db_path)
+    raise ValueError(f"Unknown storage_mode '{storage_mode}', expected 'motherduck' or 'local'")
+
+
+def snapshot_files(path: str):
+    """
+    List the published files in `path` as (seq, is_full, path), in publishing order.
+    """
+    files = []
+    for name in os.listdir(path):
+        match = _snapshot_file.match(name)
+        if match:
+            files.append((int(match.group(1)), match.group(2) is not None, os.path.join(path, name)))
+    return sorted(files)
+
+
+def create_table(con, tablename: str):
+    try:
+        # Do a basic check if the target table exists and create it if not
+        table_exists = con.execute(
+            f"SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = '\"{tablename}\"')").fetchone()[0]
+        if not table_exists:
+            con.execute(f'''
+                CREATE TABLE "{tablename}" (
+                    page_id VARCHAR UNIQUE,
+                    count INTEGER,
+                    updated_at TIMESTAMPTZ
+                );
+            ''')
+    except duckdb.CatalogException as e:
+        # If basic check failed, check for catalog error as a backup
+        if "already exists" in str(e):
+            print(f"Table '{tablename}' already exists, skipping creation.")
+        else:
+            raise  # Re-raise the exception if it's not about table existence
+
+    # Tables created before updated_at was introduced get the column added
+    con.execute(f'ALTER TABLE "{tablename}" ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ')
+
+
+class WriteBehindSync(threading.Thread):
+    """
+    Pushes pages written to the local DuckDB file to MotherDuck in the background.
+
+    The sink reports which pages it wrote with `mark_dirty()`. Every `interval`
+    seconds, or as soon as `batch_size` pages are pending, the latest counts of the
+    pending pages are read back from the local file and upserted to MotherDuck in
+    a single transaction. If the upload fails the pages stay pending and are
+    retried on the next round.
+    """
+
+    def __init__(self, con, tablename: str, interval: float = sync_interval, batch_size: int = sync_batch_size):
+        super().__init__(name="motherduck-sync", daemon=True)
+        self._local = con.cursor()  # DuckDB connections must not be shared between threads
+        self._remote = None
+        self._tablename = tablename
+        self._interval = interval
+        self._batch_size = batch_size
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def mark_dirty(self, page_ids):
+        with self._lock:
+            self._dirty.update(page_ids)
+            pending = len(self._dirty)
+        if pending >= self._batch_size:
+            self._wake.set()
+
+    def mark_all_dirty(self):
+        # Used on startup so that rows written before a restart are synced as well
+        rows = self._local.execute(f'SELECT page_id FROM "{self._tablename}"').fetchall()
+        self.mark_dirty(row[0] for row in rows)
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            self.sync()
+
+    def sync(self):
+        with self._lock:
+            page_ids, self._dirty = self._dirty, set()
+        if not page_ids:
+            return
+
+        try:
+            frame = self._local.execute(
+                f'SELECT page_id, count FROM "{self._tablename}" WHERE page_id IN (SELECT unnest(?))',
+                [list(page_ids)]).fetchdf()
+            if self._remote is None:
+                self._remote = motherduck_connect()
+                create_table(self._remote, self._tablename)
+            upsert_counts(self._remote, self._tablename, frame)
+            logger.info(f"Synced {len(frame)} pages to MotherDuck")
+        except Exception:
+            logger.exception(f"Failed to sync {len(page_ids)} pages to MotherDuck, will retry")
+            with self._lock:
+                self._dirty.update(page_ids)
+            self._remote = None  # reconnect on the next round
+
+    def stop(self):
+        # Stop the background loop and push whatever is still pending
+        self._stopped.set()
+        self._wake.set()
+        self.join()
+        self.sync()
+
+
+class SnapshotPublisher(threading.Thread):
+    """
+    Publishes the changes of a table in the local DuckDB file for other processes to read.
+
+    DuckDB lets only one process open a file while it is being written, so readers
+    can't query the writer's file. Instead, every `interval` seconds the rows updated
+    since the previous round are written to a new numbered Parquet file in the `path`
+    directory, renamed into place once complete. The first file after a start, and
+    every `full_every` files after that, hold the whole table and are marked `-full`,
+    so a reader starting or falling behind loads the latest full file and applies
+    the change files that follow it. Files older than the previous full file are
+    deleted.
+    """
+
+    def __init__(self, con, tablename: str, path: str = snapshot_path, interval: float = sync_interval,
+                 full_every: int = snapshot_full_every):
+        super().__init__(name="snapshot-publisher", daemon=True)
+        self._local = con.cursor()  # DuckDB connections must not be shared between threads
+        self._tablename = tablename
+        self._path = path
+        self._interval = interval
+        self._full_every = full_every
+        self._stopped = threading.Event()
+        os.makedirs(path, exist_ok=True)
+        files = snapshot_files(path)
+        self._seq = files[-1][0] + 1 if files else 0
+        self._watermark = None  # latest updated_at published, None until the first full file
+        self._since_full = 0
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.publish()
+            self._stopped.wait(self._interval)
+
+    def publish(self):
+        full = self._watermark is None or self._since_full >= self._full_every
+        try:
+            if full:
+                changed = self._local.execute(
+                    f'SELECT max(updated_at) FROM "{self._tablename}"').fetchone()
+                condition, params = "", []
+            else:
+                # The sink is the only writer and commits in updated_at order, so nothing committed
+                # after the max is read can carry an older updated_at. Rows committed before the copy
+                # are published again next round, which readers apply as the same upsert.
+                changed = self._local.execute(
+                    f'SELECT max(updated_at) FROM "{self._tablename}" WHERE updated_at > ?',
+                    [self._watermark]).fetchone()
+                if changed[0] is None:
+                    return
+                condition, params = "WHERE updated_at > ?", [self._watermark]
+
+            name = f"{self._seq:012d}{'-full' if full else ''}.parquet"
+            staging_path = os.path.join(self._path, f".{name}.tmp")
+            self._local.execute(
+                f'COPY (SELECT page_id, count, updated_at FROM "{self._tablename}" {condition}) '
+                f"TO '{staging_path}' (FORMAT PARQUET)", params)
+            os.replace(staging_path, os.path.join(self._path, name))
+        except Exception:
+            logger.exception(f"Failed to publish the snapshot to '{self._path}'")
+            return
+
+        self._seq += 1
+        if changed[0] is not None:
+            self._watermark = changed[0]
+        elif full:
+            # An empty table, the next rows written are all changes
+            self._watermark = datetime.min.replace(tzinfo=timezone.utc)
+        if full:
+            self._since_full = 0
+            self._remove_expired()
+        else:
+            self._since_full += 1
+
+    def _remove_expired(self):
+        # Keep the previous full file and its changes for readers that are a few rounds behind
+        fulls = [seq for seq, is_full, _ in snapshot_files(self._path) if is_full]
+        if len(fulls) < 2:
+            return
+        for seq, _, path in snapshot_files(self._path):
+            if seq < fulls[-2]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def stop(self):
+        # Publish the final counts before exiting
+        self._stopped.set()
+        self.join()
+        self.publish()
@@ -0,0 +1,86 @@
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+
+from quixstreams import Application
+
+logger = logging.getLogger(__name__)
+
+product_ids = [str(product_id) for product_id in range(1, 200)]
+event_types = ["clicked_on", "buy", "put_to_cart"]
+actions = ['view', 'hover', 'scroll', 'click']
+
+
+def trace_headers():
+    # Same headers as the producers stamp, see tracing.py in ingest-events
+    now = str(int(time.time() * 1000)).encode()
+    return [("trace_id", uuid.uuid4().hex.encode()), ("origin_ts", now), ("sent_ts", now)]
+
+
+class LoadDriver(threading.Thread):
+    """
+    Produces events at a steady rate for `duration` seconds, in place of the
+    generators whose rate can't be set.
+
+    Page actions go to `raw_topic` like User Actions Generator sends them, and
+    product events to `events_topic` like ingest-events sends them, both keyed
+    by user and with the trace headers.
+    """
+
+    def __init__(self, broker_address: str, raw_topic: str, events_topic: str, actions_per_second: float,
+                 events_per_second: float, duration: float, num_users: int, num_pages: int):
+        super().__init__(name="load-driver", daemon=True)
+        self._app = Application(broker_address=broker_address, auto_create_topics=False)
+        self._raw_topic = raw_topic
+        self._events_topic = events_topic
+        self._actions_per_second = actions_per_second
+        self._events_per_second = events_per_second
+        self._duration = duration
+        self._num_users = num_users
+        self._num_pages = num_pages
+        self.actions_sent = 0
+        self.events_sent = 0
+        self.started_at = None
+        self.finished_at = None
+
+    def run(self):
+        with self._app.get_producer() as producer:
+            self.started_at = time.monotonic()
+            while (elapsed := time.monotonic() - self.started_at) < self._duration:
+                # Catch up with the schedule, in small bursts every 10ms
+                while self.actions_sent < int(elapsed * self._actions_per_second):
+                    self._produce_action(producer)
+                while self.events_sent < int(elapsed * self._events_per_second):
+                    self._produce_event(producer)
+                producer.poll(0)
+                time.sleep(0.01)
+            producer.flush()
+            self.finished_at = time.monotonic()
+        logger.info(f"Sent {self.actions_sent} page actions and {self.events_sent} product events "
+                    f"in {self.finished_at - self.started_at:.1f}s")
+
+    def _produce_action(self, producer):
+        user_id = f"user_{random.randint(1, self._num_users)}"
+        record = {
+            "timestamp": int(time.time()),
+            "user_id": user_id,
+            "page_id": f"page_{random.randint(0, self._num_pages - 1)}",
+            "action": random.choice(actions)
+        }
+        producer.produce(topic=self._raw_topic, key=user_id, value=json.dumps(record), headers=trace_headers())
+        self.actions_sent += 1
+
+    def _produce_event(self, producer):
+        user = f"user_{random.randint(1, self._num_users)}"
+        payload = {
+            "user": user,
+            "product": random.choice(product_ids),
+            "event_type": random.choice(event_types),
+            "id": random.randint(100000, 999999),
+            "created_at": int(time.time())
+        }
+        producer.produce(topic=self._events_topic, key=user, value=json.dumps(payload), headers=trace_headers())
+        self.events_sent += 1
@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+
+import duckdb
+from confluent_kafka import ConsumerGroupState
+from confluent_kafka.admin import AdminClient, NewTopic
+from dotenv import load_dotenv
+
+load_dotenv() # for local dev, load env vars from a .env file
+
+from load import LoadDriver
+from report import GatewayProbe, LagMonitor, histogram, percentile, print_report, quantile, scrape
+from stages import Stage
+from superlinked_stub import SuperlinkedStub
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Local Kafka-compatible broker, e.g. the Redpanda container from docker-compose.yml
+broker_address = os.getenv("broker_address", "localhost:19092")
+partitions = int(os.getenv("partitions", "4"))
+
+# Load
+duration = float(os.getenv("duration", "60"))
+actions_per_second = float(os.getenv("actions_per_second", "200"))
+events_per_second = float(os.getenv("events_per_second", "50"))
+num_users = int(os.getenv("num_users", "100"))
+num_pages = int(os.getenv("num_pages", "10"))
+superlinked_delay = float(os.getenv("superlinked_delay", "0.01"))
+gateway_requests_per_second = float(os.getenv("gateway_requests_per_second", "10"))
+
+startup_timeout = float(os.getenv("startup_timeout", "120"))
+drain_timeout = float(os.getenv("drain_timeout", "120"))
+runs_dir = Path(os.getenv("runs_dir", "runs"))
+report_path = os.getenv("report_path")  # also write the report as JSON there
+
+gateway_port = int(os.getenv("gateway_port", "8080"))
+superlinked_port = int(os.getenv("superlinked_port", "8081"))
+gateway_memory_port = int(os.getenv("gateway_memory_port", "8082"))
+gateway_live_port = int(os.getenv("gateway_live_port", "8083"))
+sync_interval = float(os.getenv("sync_interval", "0.5"))  # snapshot publishing and gateway refresh
+metrics_ports = {"aggregate_page_views": 9101, "motherduck_write": 9102, "superlinked_sink": 9103}
+
+
+def create_topics(admin: AdminClient, topics: list):
+    futures = admin.create_topics([NewTopic(topic, num_partitions=partitions, replication_factor=1)
+                                   for topic in topics])
+    for future in futures.values():
+        future.result()
+
+
+def wait_for_groups(admin: AdminClient, groups: list, timeout: float):
+    # The Superlinked sink starts from the latest offsets, so the load must wait until it has its partitions
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        descriptions = [future.result() for future in admin.describe_consumer_groups(groups).values()]
+        if all(d.state == ConsumerGroupState.STABLE and d.members for d in descriptions):
+            return
+        time.sleep(1)
+    raise TimeoutError(f"Consumer groups {groups} didn't get their partitions after {timeout}s")
+
+
+def main():
+    run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    run_dir = (runs_dir / run_id).resolve()
+    run_dir.mkdir(parents=True)
+    logger.info(f"Benchmark run {run_id}, logs in {run_dir}")
+
+    # Fresh topics for every run, so no stage picks up offsets or state from a previous one
+    raw_topic = f"bench-{run_id}-raw_data"
+    processed_topic = f"bench-{run_id}-processed_data"
+    events_topic = f"bench-{run_id}-user-events"
+    admin = AdminClient({"bootstrap.servers": broker_address})
+    create_topics(admin, [raw_topic, processed_topic, events_topic])
+
+    stub = SuperlinkedStub(superlinked_port, superlinked_delay)
+    stub.start()
+
+    db_path = run_dir / "user_events.duckdb"
+    snapshot_path = run_dir / "snapshot"
+    gateway_db_path = run_dir / "gateway.duckdb"
+    stages = [
+        Stage("aggregate_page_views", "Aggregate Page Views", {
+            "raw_data_topic": raw_topic,
+            "processed_data_topic": processed_topic,
+            "consumer_group_name": f"bench-aggregate-{run_id}",
+            "metrics_port": metrics_ports["aggregate_page_views"],
+        }, consumer_group=f"bench-aggregate-{run_id}", input_topic=raw_topic),
+        Stage("motherduck_write", "MotherDuck Write", {
+            "input": processed_topic,
+            "storage_mode": "local",
+            "motherduck_sync": "false",
+            "local_db_path": db_path,
+            "db_table_name": "user_events",
+            "history_enabled": "false",
+            "snapshot_path": snapshot_path,
+            "sync_interval": sync_interval,
+            "metrics_port": metrics_ports["motherduck_write"],
+        }, consumer_group="count-consumer-v1", input_topic=processed_topic),
+        # Serves the counts MotherDuck Write published, through its own DuckDB file
+        Stage("flask_web_gateway", "Flask Web Gateway", {
+            "storage_mode": "local",
+            "motherduck_sync": "false",
+            "snapshot_path": snapshot_path,
+            "local_db_path": gateway_db_path,
+            "sync_interval": sync_interval,
+            "feed_enabled": "false",
+            "port": gateway_port,
+        }, ready_url=f"http://127.0.0.1:{gateway_port}/events"),
+        # Serves the counts straight from the processed_data topic, without any database
+        Stage("flask_web_gateway_memory", "Flask Web Gateway", {
+            "storage_mode": "memory",
+            "feed_topic": processed_topic,
+            "feed_consumer_group": f"bench-gateway-{run_id}",
+            "port": gateway_memory_port,
+            "live_port": gateway_live_port,
+        }, ready_url=f"http://127.0.0.1:{gateway_memory_port}/events"),
+        Stage("superlinked_sink", "Superlinked Server Sink", {
+            "input": events_topic,
+            "superlinked_host": "127.0.0.1",
+            "superlinked_port": superlinked_port,
+            "metrics_port": metrics_ports["superlinked_sink"],
+        }, consumer_group="superlinked-destination-v1.0", input_topic=events_topic),
+    ]
+    for stage in stages:
+        if stage.name in metrics_ports:
+            stage.metrics_url = stage.ready_url = f"http://127.0.0.1:{metrics_ports[stage.name]}/metrics"
+
+    consumers = {stage.name: (stage.consumer_group, stage.input_topic) for stage in stages if stage.consumer_group}
+    lag_monitor = LagMonitor(broker_address, consumers)
+    probes = {
+        "duckdb": GatewayProbe(f"http://127.0.0.1:{gateway_port}/events", gateway_requests_per_second),
+        "memory": GatewayProbe(f"http://127.0.0.1:{gateway_memory_port}/events", gateway_requests_per_second),
+    }
+    driver = LoadDriver(broker_address, raw_topic, events_topic, actions_per_second, events_per_second,
+                        duration, num_users, num_pages)
+    try:
+        for stage in stages:
+            stage.start(run_dir, broker_address)
+        for stage in stages:
+            stage.wait_ready(startup_timeout)
+        wait_for_groups(admin, [group for group, _ in consumers.values()], startup_timeout)
+        logger.info("All stages are ready, starting the load")
+
+        lag_monitor.start()
+        for probe in probes.values():
+            probe.start()
+        driver.start()
+        driver.join()
+
+        # Let every stage work through what is left
+        deadline = time.monotonic() + drain_timeout
+        caught_up_after = dict.fromkeys(probes)
+        while time.monotonic() < deadline:
+            for name, probe in probes.items():
+                if caught_up_after[name] is None and probe.total_count >= driver.actions_sent:
+                    caught_up_after[name] = time.monotonic() - driver.finished_at
+            if None not in caught_up_after.values() and lag_monitor.caught_up():
+                break
+            time.sleep(0.2)
+        else:
+            logger.warning(f"The pipeline didn't catch up within {drain_timeout}s, lag: {lag_monitor.current}")
+        elapsed = time.monotonic() - driver.started_at
+
+        samples = {stage.name: scrape(stage.metrics_url) for stage in stages if stage.metrics_url}
+    finally:
+        for probe in probes.values():
+            if probe.is_alive():
+                probe.stop()
+        if lag_monitor.is_alive():
+            lag_monitor.stop()
+        for stage in stages:
+            stage.stop()
+        stub.stop()
+
+    report = {
+        "run_id": run_id,
+        "load": {
+            "actions_sent": driver.actions_sent,
+            "events_sent": driver.events_sent,
+            "duration": driver.finished_at - driver.started_at,
+            "partitions": partitions,
+        },
+        "stages": {},
+    }
+    for name, stage_samples in samples.items():
+        events, buckets = histogram(stage_samples, "pipeline_end_to_end_latency_seconds", name)
+        report["stages"][name] = {
+            "events": events,
+            "throughput": events / elapsed,
+            "peak_lag": lag_monitor.peak.get(name, 0),
+            "final_lag": lag_monitor.current.get(name, 0),
+            "p50": quantile(buckets, 0.5),
+            "p95": quantile(buckets, 0.95),
+            "p99": quantile(buckets, 0.99),
+        }
+    report["gateways"] = {
+        name: {
+            "requests": len(probe.latencies) + probe.errors,
+            "errors": probe.errors,
+            "p50": percentile(probe.latencies, 0.5),
+            "p99": percentile(probe.latencies, 0.99),
+            "caught_up_after": caught_up_after[name],
+        }
+        for name, probe in probes.items()
+    }
+
+    # MotherDuck Write has stopped, so its file can be opened to check nothing was lost or counted twice
+    with duckdb.connect(str(db_path), read_only=True) as con:
+        total_count = con.execute('SELECT coalesce(sum(count), 0) FROM "user_events"').fetchone()[0]
+    report["duckdb"] = {"total_count": total_count, "consistent": total_count == driver.actions_sent}
+    report["superlinked"] = {"received": stub.received}
+
+    print_report(report)
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
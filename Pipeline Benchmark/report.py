@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+
+import requests
+from confluent_kafka import Consumer, TopicPartition
+from prometheus_client.parser import text_string_to_metric_families
+
+logger = logging.getLogger(__name__)
+
+
+def scrape(url: str) -> list:
+    """
+    Fetch the samples served by a Prometheus metrics endpoint.
+    """
+    samples = []
+    for family in text_string_to_metric_families(requests.get(url, timeout=5).text):
+        samples.extend(family.samples)
+    return samples
+
+
+def histogram(samples: list, name: str, stage: str):
+    """
+    Returns the count and the cumulative (upper bound, count) buckets of the
+    histogram `name` for `stage`.
+    """
+    buckets = sorted((float(s.labels["le"]), s.value) for s in samples
+                     if s.name == f"{name}_bucket" and s.labels.get("stage") == stage)
+    count = next((s.value for s in samples if s.name == f"{name}_count" and s.labels.get("stage") == stage), 0)
+    return count, buckets
+
+
+def quantile(buckets: list, q: float):
+    """
+    Estimate a quantile from cumulative histogram buckets, interpolating linearly
+    inside the bucket it falls in, the same way Prometheus' histogram_quantile does.
+    """
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for upper_bound, count in buckets:
+        if count >= rank:
+            if upper_bound == float("inf"):
+                return lower_bound
+            return lower_bound + (upper_bound - lower_bound) * (rank - lower_count) / max(count - lower_count, 1e-9)
+        lower_bound, lower_count = upper_bound, count
+    return lower_bound
+
+
+class LagMonitor(threading.Thread):
+    """
+    Samples every second how many messages each consumer group has yet to commit.
+    """
+
+    def __init__(self, broker_address: str, groups: dict, interval: float = 1.0):
+        super().__init__(name="lag-monitor", daemon=True)
+        self._broker_address = broker_address
+        self._groups = groups  # stage name -> (consumer group, topic)
+        self._interval = interval
+        self._stopped = threading.Event()
+        self.current = {}
+        self.peak = {}
+
+    def run(self):
+        consumers = {
+            name: Consumer({"bootstrap.servers": self._broker_address, "group.id": group,
+                            "enable.auto.commit": False})
+            for name, (group, _) in self._groups.items()
+        }
+        try:
+            while not self._stopped.is_set():
+                for name, (_, topic) in self._groups.items():
+                    try:
+                        lag = self.lag(consumers[name], topic)
+                    except Exception:
+                        logger.exception(f"Failed to measure the lag of {name}")
+                        continue
+                    self.current[name] = lag
+                    self.peak[name] = max(self.peak.get(name, 0), lag)
+                self._stopped.wait(self._interval)
+        finally:
+            for consumer in consumers.values():
+                consumer.close()
+
+    @staticmethod
+    def lag(consumer: Consumer, topic: str) -> int:
+        partitions = consumer.list_topics(topic, timeout=5).topics[topic].partitions
+        committed = consumer.committed([TopicPartition(topic, p) for p in partitions], timeout=5)
+        lag = 0
+        for tp in committed:
+            low, high = consumer.get_watermark_offsets(tp, timeout=5)
+            # Nothing committed yet means nothing consumed
+            lag += high - (tp.offset if tp.offset >= 0 else low)
+        return lag
+
+    def caught_up(self) -> bool:
+        return len(self.current) == len(self._groups) and not any(self.current.values())
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class GatewayProbe(threading.Thread):
+    """
+    Queries the gateway's /events like a dashboard would, `rate` times a
+    second, and records the response times and the total count it serves.
+    """
+
+    def __init__(self, url: str, rate: float):
+        super().__init__(name="gateway-probe", daemon=True)
+        self._url = url
+        self._rate = rate
+        self._session = requests.Session()
+        self._stopped = threading.Event()
+        self.latencies = []
+        self.errors = 0
+        self.total_count = 0
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.query()
+            self._stopped.wait(1 / self._rate)
+
+    def query(self):
+        started = time.monotonic()
+        try:
+            response = self._session.get(self._url, timeout=10)
+            response.raise_for_status()
+            self.total_count = sum(row["count"] for row in response.json())
+        except (requests.RequestException, ValueError):
+            self.errors += 1
+            return
+        self.latencies.append(time.monotonic() - started)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def percentile(values: list, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def format_seconds(value):
+    if value is None:
+        return "-"
+    return f"{value * 1000:.0f}ms" if value < 1 else f"{value:.2f}s"
+
+
+def print_report(report: dict):
+    print()
+    print(f"Load: {report['load']['actions_sent']} page actions and {report['load']['events_sent']} product events "
+          f"in {report['load']['duration']:.1f}s")
+    print()
+    header = f"{'stage':<24}{'events':>10}{'events/s':>10}{'peak lag':>10}{'p50 e2e':>10}{'p95 e2e':>10}{'p99 e2e':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, stage in report["stages"].items():
+        print(f"{name:<24}{stage['events']:>10.0f}{stage['throughput']:>10.1f}{stage['peak_lag']:>10}"
+              f"{format_seconds(stage['p50']):>10}{format_seconds(stage['p95']):>10}{format_seconds(stage['p99']):>10}")
+    print()
+    for name, gateway in report["gateways"].items():
+        print(f"Gateway /events ({name}): {gateway['requests']} requests, {gateway['errors']} errors, "
+              f"p50 {format_seconds(gateway['p50'])}, p99 {format_seconds(gateway['p99'])}, "
+              f"caught up {format_seconds(gateway['caught_up_after'])} after the load ended")
+    print(f"DuckDB: {report['duckdb']['total_count']} page actions counted "
+          f"({'consistent' if report['duckdb']['consistent'] else 'INCONSISTENT'})")
+    print(f"Superlinked stub: {report['superlinked']['received']} events received")
@@ -0,0 +1,80 @@
+import logging
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+repo_root = Path(__file__).resolve().parent.parent
+
+
+class Stage:
+    """
+    One app of the pipeline, run unchanged as a subprocess from its own folder.
+
+    The app is configured through its usual environment variables, pointed at
+    the local broker with `Quix__Broker__Address`. Its output goes to
+    `<run_dir>/<name>.log`.
+
+    Args:
+        - name: label of the stage in the report, as used by its latency metrics
+        - app: folder of the app in the repo
+        - env: environment variables set on top of the current ones
+        - consumer_group: consumer group of the app, to measure its lag
+        - input_topic: topic the app consumes
+        - metrics_url: where the app serves its Prometheus metrics, if it does
+        - ready_url: URL answering 200 once the app is ready, the metrics by default
+    """
+
+    def __init__(self, name: str, app: str, env: dict, consumer_group: str = None, input_topic: str = None,
+                 metrics_url: str = None, ready_url: str = None):
+        self.name = name
+        self.app = app
+        self.env = env
+        self.consumer_group = consumer_group
+        self.input_topic = input_topic
+        self.metrics_url = metrics_url
+        self.ready_url = ready_url or metrics_url
+        self._process = None
+        self._log = None
+
+    def start(self, run_dir: Path, broker_address: str):
+        env = {**os.environ, "Quix__Broker__Address": broker_address,
+               "Quix__State__Dir": str(run_dir / "state" / self.name), **self.env}
+        env = {key: str(value) for key, value in env.items()}
+        self._log = open(run_dir / f"{self.name}.log", "w")
+        self._process = subprocess.Popen([sys.executable, "main.py"], cwd=repo_root / self.app, env=env,
+                                         stdout=self._log, stderr=subprocess.STDOUT)
+        logger.info(f"Started {self.app} (pid {self._process.pid})")
+
+    def wait_ready(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"{self.app} exited with code {self._process.returncode}, see {self._log.name}")
+            if self.ready_url is None:
+                return
+            try:
+                if requests.get(self.ready_url, timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        raise TimeoutError(f"{self.app} wasn't ready after {timeout}s, see {self._log.name}")
+
+    def stop(self, timeout: float = 30):
+        # SIGTERM lets the apps run their shutdown: final flush, offsets commit, etc.
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                logger.warning(f"{self.app} didn't stop after {timeout}s, killing it")
+                self._process.kill()
+                self._process.wait()
+        if self._log is not None:
+            self._log.close()
@@ -0,0 +1,52 @@
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class SuperlinkedStub(threading.Thread):
+    """
+    Stands in for the Superlinked server: accepts ingested events with a 202
+    after `delay` seconds, like a server busy embedding them, and counts them.
+    """
+
+    def __init__(self, port: int, delay: float):
+        super().__init__(name="superlinked-stub", daemon=True)
+        self.port = port
+        self.delay = delay
+        self.received = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.startswith("/api/v1/ingest/"):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                json.loads(body)
+                time.sleep(stub.delay)
+                with stub._lock:
+                    stub.received += 1
+                self.send_response(202)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def run(self):
+        logger.info(f"Superlinked stub listening on port {self.port}")
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
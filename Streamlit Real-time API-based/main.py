@@ -1,7 +1,12 @@
 import streamlit as st
 import requests
 import time
+import os
+import hashlib
+import threading
+from typing import NamedTuple
 import pandas as pd
+import pyarrow as pa
 from datetime import datetime
 from bokeh.plotting import figure
 from bokeh.models import ColumnDataSource, Range1d
@@ -10,18 +15,77 @@ from bokeh.models.tools import HoverTool
 # API endpoint URL
 api_url = "https://flaskwebgateway-c8b2898-demo-superlinkeddemo-main.demo.quix.io//events"
 
-## Function to get data from the API
-def get_data():
-    print(f"[{datetime.now()}] Fetching data from API...")
-    response = requests.get(api_url)
-    data = response.json()
-    df = pd.DataFrame(data)
-    return df
-
-# Function to get data and cache it
-@st.cache_data
-def get_cached_data():
-    return get_data()
+# How often the shared poller fetches the data from the API
+poll_interval = float(os.getenv("poll_interval", "1"))
+
+class Snapshot(NamedTuple):
+    version: int
+    df: pd.DataFrame  # shared by all sessions, never modify it in place
+    fetched_at: datetime
+
+class SharedPoller(threading.Thread):
+    """
+    Fetches the data from the API once per interval for every session of the app.
+
+    Requests go through a single keep-alive session and send back the last ETag,
+    so unchanged data costs an empty 304 from the gateway. New data is published
+    as an immutable snapshot with a version number, and sessions wait for the
+    version to change instead of polling the API themselves.
+    """
+
+    def __init__(self, url, interval):
+        super().__init__(name="api-poller", daemon=True)
+        self._url = url
+        self._interval = interval
+        self._session = requests.Session()
+        self._etag = None
+        self._digest = None
+        self._updated = threading.Condition()
+        self.snapshot = None
+
+    def run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[{datetime.now()}] Failed to fetch data from API: {e}")
+            time.sleep(self._interval)
+
+    def poll(self):
+        print(f"[{datetime.now()}] Fetching data from API...")
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        # Ask for an Arrow IPC stream, which is read straight into columns without parsing JSON
+        response = self._session.get(self._url, params={"format": "arrow"}, headers=headers, timeout=10)
+        if response.status_code == 304:
+            return
+        response.raise_for_status()
+        self._etag = response.headers.get("ETag")
+
+        # Skip decoding when the payload is the same as last time
+        digest = hashlib.sha1(response.content).hexdigest()
+        if digest == self._digest:
+            return
+        self._digest = digest
+
+        df = pa.ipc.open_stream(response.content).read_all().to_pandas()
+        with self._updated:
+            version = self.snapshot.version + 1 if self.snapshot else 1
+            self.snapshot = Snapshot(version, df, datetime.now())
+            self._updated.notify_all()
+
+    def wait_for_update(self, version, timeout):
+        # Return the latest snapshot as soon as it is newer than `version`, or after `timeout` seconds
+        with self._updated:
+            self._updated.wait_for(
+                lambda: self.snapshot is not None and self.snapshot.version != version, timeout=timeout)
+            return self.snapshot
+
+# Started once per server process, and shared by all sessions
+@st.cache_resource
+def get_poller():
+    poller = SharedPoller(api_url, poll_interval)
+    poller.start()
+    return poller
 
 # Streamlit UI
 st.title("Real-time Dashboard Example Using Streamlit and Quix")
@@ -33,13 +97,26 @@ st.markdown("What users could learn: How to read from a real-time source and app
 chart_placeholder = st.empty()
 table_placeholder = st.empty()
 
-# Placeholder for countdown text
-countdown_placeholder = st.empty()
+# Placeholder for the last update time
+status_placeholder = st.empty()
+
+poller = get_poller()
+version = None
 
 # Main loop
 while True:
-    # Get the data
-    df = get_cached_data()
+    # Wait for the shared poller to publish new data
+    snapshot = poller.wait_for_update(version, timeout=10)
+    if snapshot is None:
+        status_placeholder.text("Waiting for data...")
+        continue
+    if snapshot.version == version:
+        # Streamlit only notices a closed tab at an element call, so make one on every wake-up
+        # or the loop of a gone session would keep running
+        status_placeholder.text(f"Last updated at {snapshot.fetched_at:%H:%M:%S}")
+        continue
+    version = snapshot.version
+    df = snapshot.df
 
     # Check that data is being retrieved and passed correctly
     if df.empty:
@@ -79,13 +156,4 @@ while True:
     # Display the dataframe as a table
     table_placeholder.table(df)
 
-    # Countdown
-    for i in range(1, 0, -1):
-        countdown_placeholder.text(f"Refreshing in {i} seconds...")
-        time.sleep(1)
-
-    # Clear the countdown text
-    countdown_placeholder.empty()
-
-    # Clear the cache to fetch new data
-    get_cached_data.clear()
+    status_placeholder.text(f"Last updated at {snapshot.fetched_at:%H:%M:%S}")
@@ -14,22 +14,34 @@ table_name = "user_events"
 mdtoken = os.environ['MOTHERDUCK_TOKEN']
 mddatabase = os.environ['MOTHERDUCK_DATABASE']
 
-# initiate the MotherDuck connection through a service token through
-conn = duckdb.connect(f'md:{mddatabase}?motherduck_token={mdtoken}')
+# initiate the MotherDuck connection through a service token through, shared by all browser sessions
+@st.cache_resource
+def get_connection():
+    return duckdb.connect(f'md:{mddatabase}?motherduck_token={mdtoken}')
+
+conn = get_connection()
 
 table_name = "user_events"
 
-## Function to get data from MotherDuck
-def get_data():
-    print(f"[{datetime.now()}] Running query...")
-    query = f"SELECT page_id, count FROM {table_name} ORDER BY page_id ASC"
-    df = conn.execute(query).fetchdf()
-    return df
+# Refresh every min_refresh seconds while the data changes, backing off up to max_refresh when it doesn't
+min_refresh = float(os.getenv("min_refresh", "1"))
+max_refresh = float(os.getenv("max_refresh", "10"))
 
-# Function to get data and cache it
-@st.cache_data
-def get_cached_data():
-    return get_data()
+# Rows updated this long before the watermark are fetched again, in case of clock skew between writes
+watermark_overlap = pd.Timedelta(seconds=2)
+
+## Function to get data from MotherDuck, only the rows updated since the watermark after the first call
+def get_changes(watermark):
+    print(f"[{datetime.now()}] Running query...")
+    query = f"SELECT page_id, count, updated_at FROM {table_name}"
+    params = []
+    if watermark is not None:
+        query += " WHERE updated_at >= ?"
+        params.append(watermark - watermark_overlap)
+    # Each browser session runs this script in its own thread, so each query gets its own cursor,
+    # closed straight after since the script is stopped without notice when the session ends
+    with conn.cursor() as cur:
+        return cur.execute(query + " ORDER BY page_id ASC", params).fetchdf()
 
 # Streamlit UI
 st.title("Real-time Dashboard Example Using Streamlit and Quix")
@@ -45,55 +57,72 @@ table_placeholder = st.empty()
 countdown_placeholder = st.empty()
 
 # Main loop
-while True:
-    # Get the data
-    df = get_cached_data()
+df = get_changes(None)
 
-    # Check that data is being retrieved and passed correctly
-    if df.empty:
-        st.error("No data found. Please check your data source.")
-        break
+# Check that data is being retrieved and passed correctly
+if df.empty:
+    st.error("No data found. Please check your data source.")
+    st.stop()
 
-    # Calculate dynamic min and max scales
-    min_count = df['count'].min()
-    max_count = df['count'].max()
-    min_scale = min_count * 0.99
-    max_scale = max_count * 1.01
+watermark = df['updated_at'].max() if df['updated_at'].notna().any() else None
+counts = dict(zip(df['page_id'], df['count']))
 
-    # Prepare Bokeh data source
-    source = ColumnDataSource(df)
+# Prepare Bokeh data source, updated with the changed counts
+source = ColumnDataSource({"page_id": list(df['page_id']), "count": list(df['count'])})
 
-    # Create a Bokeh figure without specifying height
-    p = figure(x_range=df['page_id'], height=400, title="Page Counts",
-               y_range=Range1d(start=min_scale, end=max_scale))
+# Create a Bokeh figure without specifying height
+p = figure(x_range=list(df['page_id']), height=400, title="Page Counts",
+           y_range=Range1d(start=0, end=1))
 
-    # Add a hover tool
-    hover = HoverTool()
-    hover.tooltips = [("Page ID", "@page_id"), ("Count", "@count")]
-    p.add_tools(hover)
+# Add a hover tool
+hover = HoverTool()
+hover.tooltips = [("Page ID", "@page_id"), ("Count", "@count")]
+p.add_tools(hover)
 
-    # Add bars to the figure
-    p.vbar(x='page_id', top='count', width=0.9, source=source)
+# Add bars to the figure
+p.vbar(x='page_id', top='count', width=0.9, source=source)
 
-    # Style the chart
-    p.xgrid.grid_line_color = None
-    p.yaxis.axis_label = "Count"
-    p.xaxis.axis_label = "Page ID"
-    p.xaxis.major_label_orientation = "vertical"  # Vertical label orientation
+# Style the chart
+p.xgrid.grid_line_color = None
+p.yaxis.axis_label = "Count"
+p.xaxis.axis_label = "Page ID"
+p.xaxis.major_label_orientation = "vertical"  # Vertical label orientation
 
-    # Display the Bokeh chart in Streamlit using st.bokeh_chart
-    chart_placeholder.bokeh_chart(p, use_container_width=True)
+changed = True
+refresh = min_refresh
 
-    # Display the dataframe as a table
-    table_placeholder.table(df)
+while True:
+    if changed:
+        # Calculate dynamic min and max scales
+        p.y_range.start = min(counts.values()) * 0.99
+        p.y_range.end = max(counts.values()) * 1.01
 
-    # Countdown
-    for i in range(1, 0, -1):
-        countdown_placeholder.text(f"Refreshing in {i} seconds...")
-        time.sleep(1)
+        # Display the Bokeh chart in Streamlit using st.bokeh_chart. Streamlit sends the whole
+        # figure again, so it is only rendered when a count changed
+        chart_placeholder.bokeh_chart(p, use_container_width=True)
 
-    # Clear the countdown text
-    countdown_placeholder.empty()
+        # Display the dataframe as a table
+        table_placeholder.table(pd.DataFrame(source.data))
 
-    # Clear the cache to fetch new data
-    get_cached_data.clear()
\ No newline at end of file
+    # Countdown
+    countdown_placeholder.text(f"Refreshing in {refresh:g} seconds...")
+    time.sleep(refresh)
+
+    # Fetch only the rows changed since the last fetch
+    changes = get_changes(watermark)
+    if changes['updated_at'].notna().any():
+        watermark = max(watermark, changes['updated_at'].max()) if watermark is not None else changes['updated_at'].max()
+    updates = {page_id: count for page_id, count in zip(changes['page_id'], changes['count'])
+               if counts.get(page_id) != count}
+    changed = bool(updates)
+
+    if updates:
+        counts.update(updates)
+        page_ids = sorted(counts)
+        # New pages change the x axis
+        if len(page_ids) != len(p.x_range.factors):
+            p.x_range.factors = page_ids
+        source.data = {"page_id": page_ids, "count": [counts[page_id] for page_id in page_ids]}
+
+    # Poll quickly while the data changes, and back off while it doesn't
+    refresh = min_refresh if changed else min(refresh * 2, max_refresh)
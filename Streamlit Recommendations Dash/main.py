@@ -1,8 +1,158 @@
-import streamlit as st
-
-# Streamlit UI
-st.title("Real-time Recommendations Query with Streamlit and Superlinked")
-
-st.markdown("**I shut down the VM running the Superlinked server to save €€ , it will be back online later....**")
-
-
+import streamlit as st
+import requests
+import pandas as pd
+import time
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+host = os.environ["superlinked_host"]
+port = os.environ["superlinked_port"]
+
+# Define the URL and headers
+url = f'http://{host}:{port}/api/v1/search/query'
+headers = {
+    'Accept': '*/*',
+    'Content-Type': 'application/json'
+}
+
+users = ["user_1", "user_2"]
+weight_names = ["description_weight", "category_weight", "name_weight",
+                "price_weight", "review_count_weight", "review_rating_weight"]
+
+refresh_interval = float(os.getenv("refresh_interval", "10"))  # results older than this are fetched again
+debounce = float(os.getenv("debounce", "0.5"))  # seconds to wait for the weights to settle before querying
+max_workers = int(os.getenv("max_workers", "8"))
+
+
+class RecommendationClient:
+    """
+    Queries Superlinked for recommendations, shared by all sessions of the app.
+
+    Queries run concurrently on a thread pool over a pooled keep-alive HTTP
+    session. Results are cached per (user, weights) for `ttl` seconds, and a
+    query already in flight is shared by everyone asking for the same key.
+    """
+
+    def __init__(self, ttl, max_workers):
+        self._ttl = ttl
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._results = {}  # (user_id, weights) -> (expires_at, future)
+
+    def get(self, user_id, weights):
+        """
+        Return a future of the recommendations for `user_id` with the `weights` tuple.
+        """
+        key = (user_id, weights)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                expires_at, future = entry
+                failed = future.done() and future.exception() is not None
+                if not future.done() or (expires_at > now and not failed):
+                    return future
+
+            future = self._executor.submit(self._query, user_id, weights)
+            self._results[key] = (now + self._ttl, future)
+            # Drop the expired results of weights nobody uses anymore
+            for stale in [k for k, (expires_at, f) in self._results.items() if expires_at <= now and f.done()]:
+                del self._results[stale]
+            return future
+
+    def prefetch(self, user_ids, weights):
+        # Start the queries for all users at once, so switching users doesn't wait on the server
+        return {user_id: self.get(user_id, weights) for user_id in user_ids}
+
+    def _query(self, user_id, weights):
+        print(f"[{datetime.now()}] Running query for {user_id}...")
+        payload = {
+            "user_id": str(user_id),
+            "query_text": "",
+            **dict(zip(weight_names, weights)),
+            "limit": 10
+        }
+
+        response = self._session.post(url, headers=headers, json=payload, timeout=30)
+        if response.status_code != 200:
+            print(f"Request failed with status code {response.status_code}: {response.text}")
+            raise RuntimeError(f"Request failed with status code {response.status_code}: {response.text}")
+        data = response.json()
+        results = data.get('results', [])
+        extracted_data = [result['obj'] for result in results]
+        return pd.DataFrame(extracted_data)
+
+
+# Created once per server process, and shared by all sessions
+@st.cache_resource
+def get_client():
+    return RecommendationClient(ttl=refresh_interval, max_workers=max_workers)
+
+
+# Streamlit UI
+st.title("Real-time Recommendations Query with Streamlit and Superlinked")
+
+# Dropdown for user selection
+user_id = st.selectbox("Select User ID", users)
+
+# Input fields for weights
+weights = []
+for name in weight_names:
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        st.write(name.replace("_", " ").title())
+    with col2:
+        weights.append(st.number_input("", min_value=0.0, max_value=10.0, value=1.0, key=name))
+weights = tuple(weights)
+
+# Placeholder for the dataframe
+data_placeholder = st.empty()
+
+# Placeholder for countdown text
+countdown_placeholder = st.empty()
+
+# Placeholder for query errors
+error_placeholder = st.empty()
+
+client = get_client()
+
+# Debounce weight changes: keep showing the last results while the weights are being edited.
+if st.session_state.get("weights") not in (None, weights):
+    if "results" in st.session_state:
+        data_placeholder.dataframe(st.session_state["results"])
+    countdown_placeholder.text("Updating...")
+    time.sleep(debounce)
+    # Streamlit only stops a run for a newer one at its next element call, so make one before
+    # querying: after another change during the pause, this run ends here and nothing is queried
+    countdown_placeholder.empty()
+st.session_state["weights"] = weights
+
+# Main loop
+while True:
+    # Fetch the recommendations of every user, and show the selected one as soon as it's ready
+    futures = client.prefetch(users, weights)
+    try:
+        df = futures[user_id].result()
+        error_placeholder.empty()
+    except Exception as e:
+        error_placeholder.error(str(e))
+        df = pd.DataFrame()
+    st.session_state["results"] = df
+
+    # Display the dataframe
+    data_placeholder.dataframe(df)
+
+    # Countdown
+    for i in range(int(refresh_interval), 0, -1):
+        countdown_placeholder.text(f"Refreshing in {i} seconds...")
+        time.sleep(1)
+
+    # Clear the countdown text
+    countdown_placeholder.empty()
@@ -1,40 +1,52 @@
 from quixstreams import Application
-import random
 import time
 import os
 import json
+import logging
 import requests
+from requests.adapters import HTTPAdapter
 # for local dev, load env vars from a .env file
 from dotenv import load_dotenv
 load_dotenv()
 
+import tracing
+from sink import SuperlinkedSink
+
+logging.basicConfig(level=logging.INFO)
+
 superlinked_host=os.environ['superlinked_host']
 superlinked_port=os.environ['superlinked_port']
 
+# Events of different users are sent concurrently, the events of one user always in order
+sink_workers = int(os.getenv("sink_workers", "8"))
+max_pending = int(os.getenv("max_pending", "1000"))  # most events in flight before consuming waits
+send_retries = int(os.getenv("send_retries", "3"))  # retries of a failed send before its lane stops
+send_backoff = float(os.getenv("send_backoff", "0.5"))  # seconds before the first retry, doubled on each one
+
+# Keep-alive connections shared by the sink's lanes
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_maxsize=sink_workers))
+
 app = Application(consumer_group="superlinked-destination-v1.0",auto_offset_reset="latest")
 
 input_topic = app.topic(os.environ["input"])
 
-# Function to generate random event ID
-def generate_random_event_id():
-    return f"event_{random.randint(1000, 9999)}"
-
 # Function to generate current timestamp
 def generate_current_timestamp():
     return int(time.time())
 
-def send_data_to_superlinked(data: dict) -> None:
+def send_data_to_superlinked(data: dict, headers, event_id: str) -> None:
 
     payload = {
             "user": data['user'],
             "product": data['product'],
             "event_type": data['event_type'],
-            "id": generate_random_event_id(),  # Generate random event ID
+            "id": f"event_{event_id}",  # The same when the event is sent again
             "created_at": generate_current_timestamp()  # Generate current timestamp
         }
 
 
-    response = requests.post(
+    response = session.post(
         f'http://{superlinked_host}:{superlinked_port}/api/v1/ingest/event_schema',
         headers={
             'Accept': '*/*',
@@ -49,11 +61,16 @@ def send_data_to_superlinked(data: dict) -> None:
     if response.status_code != 202:
         with open('error_log.txt', 'a') as log_file:
             log_file.write(f"Failed event {payload['id']}: {response.status_code} - {response.text}\n")
+    else:
+        # The event has reached Superlinked
+        tracing.observe("superlinked_sink", headers)
 
 
 sdf = app.dataframe(input_topic)
-sdf = sdf.update(send_data_to_superlinked)
+sdf.sink(SuperlinkedSink(send_data_to_superlinked, workers=sink_workers, max_pending=max_pending,
+                         retries=send_retries, backoff=send_backoff))
 
 if __name__ == "__main__":
     print("Starting application")
+    tracing.start()
     app.run(sdf)
\ No newline at end of file
@@ -0,0 +1,89 @@
+import logging
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from quixstreams.sinks import BaseSink
+
+logger = logging.getLogger(__name__)
+
+
+class SuperlinkedSink(BaseSink):
+    """
+    Sends events to Superlinked as they arrive, several at a time.
+
+    Each record is handed to one of `workers` lanes picked from its message key.
+    A lane is a single thread sending its events one after the other, so all the
+    events of a key (a user) reach Superlinked in the order they were produced,
+    while events of other keys and other partitions are sent concurrently.
+
+    A failed send is retried in its lane up to `retries` times, waiting `backoff`
+    seconds doubled on each attempt. If it still fails the lane stops: the events
+    queued behind it are skipped, so no event of its keys overtakes the one that
+    wasn't delivered, until the checkpoint fails and is consumed again.
+
+    Offsets are only committed once everything sent before the checkpoint has
+    been delivered: `flush()` waits for the pending sends and fails the
+    checkpoint if any lane stopped. At most `max_pending` events are in flight,
+    after which consuming waits for the oldest one. Each event is sent with an id
+    made of its topic, partition and offset, so the events of a checkpoint that
+    is consumed again keep the ids they were delivered with.
+    """
+
+    def __init__(self, send, workers: int, max_pending: int, retries: int = 3, backoff: float = 0.5):
+        super().__init__()
+        self._send = send
+        self._lanes = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"superlinked-lane-{i}")
+                       for i in range(workers)]
+        self._max_pending = max_pending
+        self._retries = retries
+        self._backoff = backoff
+        self._pending = deque()
+        self._failed = [None] * workers  # the error that stopped each lane since the last flush
+
+    def add(self, value, key, timestamp, headers, topic, partition, offset):
+        while len(self._pending) >= self._max_pending:
+            # Only waits, the error of a failed send is kept by its lane until the flush
+            self._pending.popleft().exception()
+        lane = self._lane_of(key)
+        if self._failed[lane] is not None:
+            return
+        self._pending.append(self._lanes[lane].submit(
+            self._deliver, lane, value, headers, f"{topic}-{partition}-{offset}"))
+
+    def _lane_of(self, key) -> int:
+        # crc32 rather than hash(), so a key always maps to the same lane
+        if key is None:
+            return 0
+        if isinstance(key, str):
+            key = key.encode()
+        return zlib.crc32(key) % len(self._lanes)
+
+    def _deliver(self, lane: int, value, headers, event_id: str):
+        if self._failed[lane] is not None:
+            return
+        for attempt in range(self._retries + 1):
+            try:
+                self._send(value, headers, event_id)
+                return
+            except Exception as e:
+                if attempt == self._retries:
+                    logger.error(f"Sending event {event_id} failed after {attempt + 1} attempts, "
+                                 f"stopping lane {lane} until the checkpoint is consumed again: {e!r}")
+                    self._failed[lane] = e
+                    return
+                time.sleep(self._backoff * 2 ** attempt)
+
+    def flush(self):
+        pending, self._pending = self._pending, deque()
+        sent = len(pending)
+        # Wait for all of them before raising, so no event is still being sent on retry
+        for future in pending:
+            future.exception()
+        errors = [error for error in self._failed if error is not None]
+        self._failed = [None] * len(self._lanes)
+        if errors:
+            raise errors[0]
+        if sent:
+            logger.info(f"Delivered {sent} events to Superlinked")
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from sink import SuperlinkedSink
+
+
+class FlakySend:
+    """
+    Records the events delivered, failing the ones in `failures` that many times.
+    """
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.delivered = []
+        self.attempts = []
+        self._lock = threading.Lock()
+
+    def __call__(self, value, headers, event_id):
+        with self._lock:
+            self.attempts.append(value)
+            if self.failures.get(value, 0) > 0:
+                self.failures[value] -= 1
+                raise ConnectionError(f"failed to send {value}")
+            self.delivered.append((value, event_id))
+
+
+def add_all(sink, key, values, offset=0):
+    for i, value in enumerate(values):
+        sink.add(value, key, 0, [], "events", 0, offset + i)
+
+
+def test_mid_sequence_failure_stops_the_lane_until_flush():
+    send = FlakySend(failures={3: 100})
+    sink = SuperlinkedSink(send, workers=2, max_pending=100, retries=1, backoff=0)
+
+    add_all(sink, b"user_1", [1, 2, 3, 4, 5])
+    with pytest.raises(ConnectionError):
+        sink.flush()
+
+    # Nothing of the key went out past the failed event, which was retried in its lane
+    assert [value for value, _ in send.delivered] == [1, 2]
+    assert send.attempts == [1, 2, 3, 3]
+
+    # The checkpoint is consumed again, with the same offsets and so the same event ids
+    send.failures.clear()
+    add_all(sink, b"user_1", [1, 2, 3, 4, 5])
+    sink.flush()
+    assert [value for value, _ in send.delivered] == [1, 2, 1, 2, 3, 4, 5]
+    assert send.delivered[:2] == send.delivered[2:4]
+
+
+def test_failure_stops_only_its_own_lane():
+    send = FlakySend(failures={"a2": 100})
+    sink = SuperlinkedSink(send, workers=2, max_pending=100, retries=0, backoff=0)
+    # Both keys map to different lanes
+    assert sink._lane_of(b"user_1") != sink._lane_of(b"user_4")
+
+    for i in range(1, 4):
+        sink.add(f"a{i}", b"user_1", 0, [], "events", 0, i)
+        sink.add(f"b{i}", b"user_4", 0, [], "events", 1, i)
+    with pytest.raises(ConnectionError):
+        sink.flush()
+
+    delivered = [value for value, _ in send.delivered]
+    assert [value for value in delivered if value.startswith("a")] == ["a1"]
+    assert [value for value in delivered if value.startswith("b")] == ["b1", "b2", "b3"]
+
+
+def test_transient_failure_is_retried_in_order():
+    send = FlakySend(failures={2: 2})
+    sink = SuperlinkedSink(send, workers=1, max_pending=2, retries=2, backoff=0)
+
+    add_all(sink, b"user_1", [1, 2, 3, 4])
+    sink.flush()
+    assert [value for value, _ in send.delivered] == [1, 2, 3, 4]
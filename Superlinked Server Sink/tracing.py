@@ -0,0 +1,55 @@
+import logging
+import os
+import time
+
+from prometheus_client import Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+metrics_port = int(os.getenv("metrics_port", "9100"))
+
+# Headers stamped on every event by the producers and carried along the pipeline:
+#   trace_id  - identifies the event across topics
+#   origin_ts - when the event was created, in milliseconds since the epoch
+#   sent_ts   - when the last stage produced the message, in milliseconds since the epoch
+TRACE_ID = "trace_id"
+ORIGIN_TS = "origin_ts"
+SENT_TS = "sent_ts"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# Latency metrics, scraped from http://<host>:<metrics_port>/metrics
+stage_latency = Histogram(
+    "pipeline_stage_latency_seconds", "Time from the previous stage producing an event to this stage handling it",
+    ["stage"], buckets=LATENCY_BUCKETS)
+end_to_end_latency = Histogram(
+    "pipeline_end_to_end_latency_seconds", "Time from an event being created to this stage handling it",
+    ["stage"], buckets=LATENCY_BUCKETS)
+
+
+def start():
+    start_http_server(metrics_port)
+    logger.info(f"Serving metrics on port {metrics_port}")
+
+
+def _header(headers, name):
+    for key, value in headers or ():
+        if key == name:
+            return value.decode() if isinstance(value, bytes) else value
+    return None
+
+
+def observe(stage: str, headers):
+    """
+    Record how long the event took to reach `stage`, from its trace headers.
+    Events produced without them are ignored.
+    """
+    now = time.time()
+    trace_id = _header(headers, TRACE_ID)
+    # The trace id is attached as an exemplar, so slow events can be looked up
+    exemplar = {"trace_id": trace_id} if trace_id else None
+    if sent_ts := _header(headers, SENT_TS):
+        stage_latency.labels(stage=stage).observe(max(0.0, now - int(sent_ts) / 1000), exemplar)
+    if origin_ts := _header(headers, ORIGIN_TS):
+        end_to_end_latency.labels(stage=stage).observe(max(0.0, now - int(origin_ts) / 1000), exemplar)
+
@@ -0,0 +1,39 @@
+import threading
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Keeps the last `size` values appended, overwriting the oldest ones.
+
+    Appending is O(1) and the memory used never grows, however long the
+    dashboard runs. Values are appended from the socket thread and read from
+    the broadcast thread, hence the lock.
+    """
+
+    def __init__(self, size: int):
+        self._values = np.zeros(size)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self._values.size)
+
+    def append(self, value: float):
+        with self._lock:
+            self._values[self._count % self._values.size] = value
+            self._count += 1
+
+    def snapshot(self):
+        """
+        Returns:
+            - the number of values appended before the oldest one still kept
+            - a copy of the values kept, from oldest to newest
+        """
+        with self._lock:
+            start = max(self._count - self._values.size, 0)
+            head = self._count % self._values.size
+            if self._count <= self._values.size:
+                return start, self._values[:self._count].copy()
+            return start, np.concatenate((self._values[head:], self._values[:head]))
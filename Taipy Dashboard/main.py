@@ -1,22 +1,16 @@
+import os
 import socket
-import pickle
-import math
-from threading import Thread
-from taipy.gui import Gui, State, invoke_callback, get_state_id
-import numpy as np
+import time
+from threading import Event, Thread
+from taipy.gui import Gui, State, get_state_id, invoke_callback
 import pandas as pd
 
-init_lat = 49.247
-init_long = 1.377
+from history import RingBuffer
+from protocol import FrameReader
+from simulation import PollutionField, init_lat, init_long
 
-factory_lat = 49.246
-factory_long = 1.369
-
-diff_lat = abs(init_lat - factory_lat) * 15
-diff_long = abs(init_long - factory_long) * 15
-
-lats_unique = np.arange(init_lat - diff_lat, init_lat + diff_lat, 0.001)
-longs_unique = np.arange(init_long - diff_long, init_long + diff_long, 0.001)
+max_fps = float(os.getenv("max_fps", "10"))  # most updates per second pushed to the browsers
+history_size = int(os.getenv("history_size", "30"))  # number of frames shown on the Max AQI chart
 
 countdown = 20
 periods = 0
@@ -83,37 +77,12 @@ options = {
 config = {"scrollZoom": False, "displayModeBar": False}
 
 
-def pollution(lat: float, long: float):
-    """
-    Return pollution level in percentage
-    Pollution should be centered around the factory
-    Pollution should decrease with distance to factory
-    Pollution should have an added random component
-
-    Args:
-        - lat: latitude
-        - long: longitude
-
-    Returns:
-        - pollution level
-    """
-    global countdown
-    return 80 * (0.5 + 0.5 * math.sin(countdown / 20)) * math.exp(
-        -(0.8 * (lat - factory_lat) ** 2 + 0.2 * (long - factory_long) ** 2) / 0.00005
-    ) + np.random.randint(0, 50)
-
-
-lats = []
-longs = []
-pollutions = []
-times = []
-max_pollutions = []
-
-for lat in lats_unique:
-    for long in longs_unique:
-        lats.append(lat)
-        longs.append(long)
-        pollutions.append(pollution(lat, long))
+# Same grid as the sender, so the received levels line up with these coordinates
+field = PollutionField()
+lats = field.lats
+longs = field.longs
+pollutions = field.update(countdown).copy()
+max_pollutions = RingBuffer(history_size)
 
 data_province_displayed = pd.DataFrame(
     {
@@ -125,63 +94,85 @@ data_province_displayed = pd.DataFrame(
 
 max_pollution = data_province_displayed["Pollution"].max()
 
+frame_received = Event()
+
 
 # Socket handler
-def client_handler(gui: Gui, state_id_list: list):
+def client_handler():
+    global pollutions
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     s.bind((HOST, PORT))
     s.listen()
     conn, _ = s.accept()
+    reader = FrameReader(conn)
+    while (frame := reader.read()) is not None:
+        print(f"Data received: {frame[:5]}")
+        # Every frame goes into the history, even those the broadcast skips
+        max_pollutions.append(float(frame.max()))
+        # The reader overwrites its buffer with the next frame
+        pollutions = frame.copy()
+        frame_received.set()
+    print("Connection closed")
+
+
+# Broadcast handler
+def broadcaster(gui: Gui):
+    """
+    Push the latest frame to every browser, at most `max_fps` times per second.
+
+    The data frames are built once per update and assigned once, from a single
+    session, to variables shared by all sessions: Taipy then sends them to every
+    browser in one emit, so the cost of a frame doesn't grow with the number of
+    browsers. Browsers that disconnect simply stop receiving the updates.
+    """
+    global data_province_displayed, line_data, periods
     while True:
-        if data := conn.recv(1024 * 1024):
-            pollutions = pickle.loads(data)
-            print(f"Data received: {pollutions[:5]}")
-            if hasattr(gui, "_server") and state_id_list:
-                invoke_callback(
-                    gui,
-                    state_id_list[0],
-                    update_pollutions,
-                    [pollutions],
-                )
-        else:
-            print("Connection closed")
-            break
+        frame_received.wait()
+        frame_received.clear()
+
+        data_province_displayed = pd.DataFrame(
+            {
+                "Latitude": lats,
+                "Longitude": longs,
+                "Pollution": pollutions,
+            },
+            copy=False,
+        )
+        # Add an hour to the time for each frame
+        start, values = max_pollutions.snapshot()
+        periods = start + len(values)
+        line_data = pd.DataFrame(
+            {
+                "Time": pd.date_range(
+                    pd.Timestamp("2020-11-04") + pd.Timedelta(hours=start), periods=len(values), freq="h"
+                ),
+                "Max AQI": values,
+            }
+        )
+
+        # Sessions opened later start from the module variables set above
+        if broadcast_state_id is not None:
+            invoke_callback(gui, broadcast_state_id, update_pollutions, [data_province_displayed, line_data])
+        time.sleep(1 / max_fps)
 
 
 # Gui declaration
-state_id_list = []
+Gui.add_shared_variables("data_province_displayed", "line_data")
 
-Gui.add_shared_variable("pollutions")
+# Session the shared variables are assigned from, which pushes them to every browser
+broadcast_state_id = None
 
 
 def on_init(state: State):
-    state_id = get_state_id(state)
-    if (state_id := get_state_id(state)) is not None and state_id != "":
-        state_id_list.append(state_id)
-    update_pollutions(state, pollutions)
-
-
-def update_pollutions(state: State, val):
-    state.pollutions = val
-    state.data_province_displayed = pd.DataFrame(
-        {
-            "Latitude": lats,
-            "Longitude": longs,
-            "Pollution": state.pollutions,
-        }
-    )
-    # Add an hour to the time
-    state.periods = state.periods + 1
-    state.max_pollutions = state.max_pollutions + [max(state.pollutions)]
-    state.times = pd.date_range(
-        "2020-11-04", periods=len(state.max_pollutions), freq="H"
-    )
-    state.line_data = pd.DataFrame(
-        {
-            "Time": state.times,
-            "Max AQI": state.max_pollutions,
-        }
-    )
+    global broadcast_state_id
+    # Taipy keeps the data of a session after its browser disconnects, so the first one stays usable
+    if broadcast_state_id is None:
+        broadcast_state_id = get_state_id(state)
+
+
+def update_pollutions(state: State, data, history):
+    state.data_province_displayed = data
+    state.line_data = history
 
 
 page = """
@@ -199,18 +190,14 @@ page = """
 |>
 
 <|part|class_name=card|
-<|{line_data[-30:]}|chart|type=lines|x=Time|y=Max AQI|layout={layout_line}|height=40vh|>
+<|{line_data}|chart|type=lines|x=Time|y=Max AQI|layout={layout_line}|height=40vh|>
 |>
 |>
 """
 gui = Gui(page=page)
 
-t = Thread(
-    target=client_handler,
-    args=(
-        gui,
-        state_id_list,
-    ),
-)
+t = Thread(target=client_handler)
 t.start()
+b = Thread(target=broadcaster, args=(gui,))
+b.start()
 gui.run(run_browser=False)
@@ -0,0 +1,142 @@
+import os
+import struct
+
+import numpy as np
+
+# Send only the cells that changed since the previous frame, when that is smaller than the whole field
+delta_encoding = os.getenv("delta_encoding", "false").lower() == "true"
+# Round the levels to multiples of this step and send them as 16-bit integers, 0 sends exact float32 levels
+quantize_step = float(os.getenv("quantize_step", "0"))
+
+# Every frame starts with: flags, number of cells in the field, number of entries in the payload,
+# quantization step. The payload follows, with the cell indices first for a delta frame, then the values.
+HEADER = struct.Struct("<BIIf")
+DELTA = 0x01
+QUANTIZED = 0x02
+
+MAX_CELLS = 1 << 26  # refuse anything larger than 256 MB of float32 levels, it can only be a broken stream
+
+
+class ProtocolError(Exception):
+    """
+    Raised when the stream does not hold a valid frame.
+    """
+
+
+class FrameWriter:
+    """
+    Sends pollution fields over a socket as length-prefixed binary frames.
+
+    A full frame is the field as raw little-endian float32, or 16-bit integers
+    when quantized. With `delta`, a frame only holds the indices and values of
+    the cells that changed since the previous one, whenever that is smaller than
+    the full frame. The first frame on a connection is always a full one.
+    """
+
+    def __init__(self, sock, delta: bool = delta_encoding, step: float = quantize_step):
+        self._sock = sock
+        self._delta = delta
+        self._step = step
+        self._sent = None  # the field as the receiver has it after the last frame
+
+    def send(self, values: np.ndarray) -> int:
+        """
+        Send the field `values`, and return the size of the frame in bytes.
+        """
+        values = np.asarray(values, dtype="<f4")
+        flags = 0
+        if self._step > 0:
+            flags |= QUANTIZED
+            encoded = np.clip(np.rint(values / self._step), 0, np.iinfo(np.uint16).max).astype("<u2")
+            received = encoded * np.float32(self._step)
+        else:
+            encoded = received = values
+
+        parts = [encoded]
+        entries = encoded.size
+        if self._delta and self._sent is not None and self._sent.size == values.size:
+            changed = np.flatnonzero(received != self._sent).astype("<u4")
+            # Each changed cell costs its index on top of its value
+            if changed.nbytes + changed.size * encoded.itemsize < encoded.nbytes:
+                flags |= DELTA
+                parts = [changed, encoded[changed]]
+                entries = changed.size
+
+        header = HEADER.pack(flags, values.size, entries, self._step)
+        self._sock.sendall(header)
+        for part in parts:
+            self._sock.sendall(part)
+
+        if self._delta:
+            if self._sent is None or self._sent.size != values.size:
+                self._sent = np.empty_like(received)
+            np.copyto(self._sent, received)
+        return len(header) + sum(part.nbytes for part in parts)
+
+
+class FrameReader:
+    """
+    Reads the frames sent by a FrameWriter from a socket.
+
+    `values` holds the latest field. Full float32 frames are received straight
+    into it, other frames into a scratch buffer that is reused between frames
+    and decoded from there through `np.frombuffer` views.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._header = bytearray(HEADER.size)
+        self._scratch = bytearray()
+        self.values = np.empty(0, dtype="<f4")
+
+    def read(self):
+        """
+        Wait for the next frame and return the updated field, or None when the
+        sender closed the connection. The array is overwritten by the next frame,
+        copy it if it has to be kept.
+        """
+        if not self._fill(memoryview(self._header), eof=True):
+            return None
+        flags, cells, entries, step = HEADER.unpack(self._header)
+        if flags & ~(DELTA | QUANTIZED) or cells > MAX_CELLS or entries > cells:
+            raise ProtocolError(f"Invalid frame header: flags={flags} cells={cells} entries={entries}")
+
+        if self.values.size != cells:
+            if flags & DELTA:
+                raise ProtocolError(f"Delta frame for {cells} cells, but the field has {self.values.size}")
+            self.values = np.zeros(cells, dtype="<f4")
+
+        if not flags:
+            self._fill(memoryview(self.values).cast("B"))
+            return self.values
+
+        value_type = np.dtype("<u2" if flags & QUANTIZED else "<f4")
+        index_size = entries * 4 if flags & DELTA else 0
+        size = index_size + entries * value_type.itemsize
+        if len(self._scratch) < size:
+            self._scratch = bytearray(size)
+        self._fill(memoryview(self._scratch)[:size])
+
+        levels = np.frombuffer(self._scratch, dtype=value_type, count=entries, offset=index_size)
+        if flags & QUANTIZED:
+            levels = levels * np.float32(step)
+        if flags & DELTA:
+            indices = np.frombuffer(self._scratch, dtype="<u4", count=entries)
+            if entries and indices.max() >= cells:
+                raise ProtocolError(f"Delta frame refers to a cell out of the {cells} of the field")
+            self.values[indices] = levels
+        else:
+            self.values[:] = levels
+        return self.values
+
+    def _fill(self, view: memoryview, eof: bool = False) -> bool:
+        # Keep receiving until the view is full, a frame may arrive in any number of pieces
+        received = 0
+        while received < len(view):
+            n = self._sock.recv_into(view[received:])
+            if n == 0:
+                if eof and received == 0:
+                    return False
+                raise ProtocolError("Connection closed in the middle of a frame")
+            received += n
+        return True
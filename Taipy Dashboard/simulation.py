@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+
+init_lat = 49.247
+init_long = 1.377
+
+factory_lat = 49.246
+factory_long = 1.369
+
+diff_lat = abs(init_lat - factory_lat) * 15
+diff_long = abs(init_long - factory_long) * 15
+
+# Distance between two cells of the grid, in degrees.
+# The default gives a 30 x 241 grid, 0.000085 gives about a million cells.
+grid_resolution = float(os.getenv("grid_resolution", "0.001"))
+
+# Seed of the random component, leave empty for a different field on every run
+seed = int(os.environ["seed"]) if os.getenv("seed") else None
+
+
+class PollutionField:
+    """
+    Pollution levels over a grid of cells around the factory.
+
+    Pollution is centered around the factory, decreases with distance to it and
+    has an added random component. The cells are laid out latitude by latitude,
+    the same as the original nested loops over `lats_unique` and `longs_unique`.
+
+    The distance term never changes, so it is computed once for the whole grid.
+    Each `update()` only scales it by the time-dependent amplitude and adds the
+    noise, writing into buffers allocated once, so a frame costs a few passes of
+    NumPy over the grid and no allocations.
+    """
+
+    def __init__(self, resolution: float = grid_resolution, seed: int = seed):
+        self.lats_unique = np.arange(init_lat - diff_lat, init_lat + diff_lat, resolution)
+        self.longs_unique = np.arange(init_long - diff_long, init_long + diff_long, resolution)
+
+        lat_grid, long_grid = np.meshgrid(self.lats_unique, self.longs_unique, indexing="ij")
+        self.lats = lat_grid.ravel()
+        self.longs = long_grid.ravel()
+
+        self._falloff = np.exp(
+            -(0.8 * (self.lats - factory_lat) ** 2 + 0.2 * (self.longs - factory_long) ** 2) / 0.00005
+        ).astype(np.float32)
+        self._rng = np.random.default_rng(seed)
+        self._noise = np.empty(self.size, dtype=np.float32)
+        self.pollutions = np.empty(self.size, dtype=np.float32)
+
+    @property
+    def size(self):
+        return self.lats.size
+
+    def update(self, countdown: float) -> np.ndarray:
+        """
+        Compute the pollution levels at time `countdown`.
+
+        Returns:
+            - the pollution level of every cell. The array is overwritten by the
+              next update, copy it if it has to be kept.
+        """
+        amplitude = 80 * (0.5 + 0.5 * np.sin(countdown / 20))
+        np.multiply(self._falloff, amplitude, out=self.pollutions)
+
+        # Whole numbers from 0 to 49, like np.random.randint(0, 50)
+        self._rng.random(out=self._noise, dtype=np.float32)
+        self._noise *= 50
+        np.floor(self._noise, out=self._noise)
+        self.pollutions += self._noise
+        return self.pollutions
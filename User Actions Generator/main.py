@@ -9,6 +9,9 @@ import logging
 from dotenv import load_dotenv
 
 load_dotenv()
+
+import tracing
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -16,6 +19,11 @@ logger = logging.getLogger(__name__)
 # Initialize the Quix Application with the connection configuration
 app = Application()
 topic = app.topic(os.getenv("raw_data_topic","raw_data"))
+
+# What the messages are keyed by:
+#   user  - the user, so all the actions of a user land on the same partition, in order (default)
+#   event - a random id per action, spreading the actions evenly but without any ordering per user
+message_key = os.getenv("message_key", "user")
 # for more help using QuixStreams see docs: https://quix.io/docs/quix-streams/introduction.html
 
 def main():
@@ -38,8 +46,9 @@ def main():
             logger.info(f"Publishing row: {json_data}")
             producer.produce(
                 topic=topic.name,
-                key=str(uuid.uuid4()),
+                key=record["user_id"] if message_key == "user" else str(uuid.uuid4()),
                 value=json_data,
+                headers=tracing.trace_headers(),  # lets the next stages measure the event's latency
             )
 
             time.sleep(random.uniform(0.1, 1))
@@ -0,0 +1,18 @@
+import time
+import uuid
+
+# Headers stamped on every event and carried along the pipeline:
+#   trace_id  - identifies the event across topics
+#   origin_ts - when the event was created, in milliseconds since the epoch
+#   sent_ts   - when the last stage produced the message, in milliseconds since the epoch
+TRACE_ID = "trace_id"
+ORIGIN_TS = "origin_ts"
+SENT_TS = "sent_ts"
+
+
+def trace_headers():
+    """
+    Start a new trace, returns the headers to produce the event with.
+    """
+    now = str(int(time.time() * 1000)).encode()
+    return [(TRACE_ID, uuid.uuid4().hex.encode()), (ORIGIN_TS, now), (SENT_TS, now)]
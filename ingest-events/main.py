@@ -13,6 +13,8 @@ from collections import defaultdict
 from dotenv import load_dotenv
 load_dotenv()
 
+import tracing
+
 # superlinked_address = "34.71.253.51"
 
 # List of product IDs
@@ -40,6 +42,11 @@ app = Application(consumer_group="data_source", auto_create_topics=True)  # crea
 topic_name = os.environ["output"]
 topic = app.topic(topic_name)
 
+# What the messages are keyed by:
+#   user  - the user, so all the events of a user land on the same partition, in order (default)
+#   event - the event id, spreading the events evenly but without any ordering per user
+message_key = os.getenv("message_key", "user")
+
 def main():
     """
     Read data from the hardcoded dataset and publish it to Kafka
@@ -87,8 +94,9 @@ def main():
             # publish the data to the topic
             producer.produce(
                 topic=topic.name,
-                key=str(payload['id']),
+                key=payload['user'] if message_key == "user" else str(payload['id']),
                 value=json_data,
+                headers=tracing.trace_headers(),  # lets the next stages measure the event's latency
             )
 
             # for more help using QuixStreams see docs:
@@ -1,26 +1,44 @@
-from superlinked.framework.common.schema.id_schema_object import IdField
-from superlinked.framework.common.embedding.number_embedding import Mode
-from superlinked.framework.common.schema.schema import schema
-from superlinked.framework.common.schema.event_schema import event_schema
-from superlinked.framework.common.schema.schema_object import String, Integer
-from superlinked.framework.common.schema.event_schema_object import (
-    CreatedAtField,
-    SchemaReference,
-)
-from superlinked.framework.dsl.executor.rest.rest_configuration import (
-    RestQuery,
-)
-from superlinked.framework.dsl.executor.rest.rest_descriptor import RestDescriptor
-from superlinked.framework.dsl.executor.rest.rest_executor import RestExecutor
-from superlinked.framework.dsl.index.index import Index
-from superlinked.framework.dsl.index.effect import Effect
-from superlinked.framework.dsl.query.param import Param
-from superlinked.framework.dsl.query.query import Query
-from superlinked.framework.dsl.registry.superlinked_registry import SuperlinkedRegistry
-from superlinked.framework.dsl.source.rest_source import RestSource
-from superlinked.framework.dsl.space.text_similarity_space import TextSimilaritySpace
-from superlinked.framework.dsl.space.number_space import NumberSpace
-from superlinked.framework.dsl.storage.redis_vector_database import RedisVectorDatabase
+import logging
+import os
+
+try:
+    from superlinked_app import startup
+except ImportError:  # loaded from within the folder
+    import startup
+
+logging.basicConfig(level=logging.INFO)
+
+text_model = os.getenv("text_model", "sentence-transformers/all-distilroberta-v1")
+redis_host = os.getenv("redis_host", "redis-18118.c328.europe-west3-1.gce.cloud.redislabs.com")
+redis_port = int(os.getenv("redis_port", "18118"))
+
+# Started before the framework is imported, the model is fetched while it imports
+prefetch_threads = startup.prefetch([text_model])
+
+with startup.phase("import_framework"):
+    from superlinked.framework.common.schema.id_schema_object import IdField
+    from superlinked.framework.common.embedding.number_embedding import Mode
+    from superlinked.framework.common.schema.schema import schema
+    from superlinked.framework.common.schema.event_schema import event_schema
+    from superlinked.framework.common.schema.schema_object import String, Integer
+    from superlinked.framework.common.schema.event_schema_object import (
+        CreatedAtField,
+        SchemaReference,
+    )
+    from superlinked.framework.dsl.executor.rest.rest_configuration import (
+        RestQuery,
+    )
+    from superlinked.framework.dsl.executor.rest.rest_descriptor import RestDescriptor
+    from superlinked.framework.dsl.executor.rest.rest_executor import RestExecutor
+    from superlinked.framework.dsl.index.index import Index
+    from superlinked.framework.dsl.index.effect import Effect
+    from superlinked.framework.dsl.query.param import Param
+    from superlinked.framework.dsl.query.query import Query
+    from superlinked.framework.dsl.registry.superlinked_registry import SuperlinkedRegistry
+    from superlinked.framework.dsl.source.rest_source import RestSource
+    from superlinked.framework.dsl.space.text_similarity_space import TextSimilaritySpace
+    from superlinked.framework.dsl.space.number_space import NumberSpace
+    from superlinked.framework.dsl.storage.redis_vector_database import RedisVectorDatabase
 
 
 # Define schemas
@@ -55,28 +73,29 @@ product_schema = ProductSchema()
 user_schema = UserSchema()
 event_schema = EventSchema()
 
-# Define spaces
-description_space = TextSimilaritySpace(
-    text=[user_schema.preference_description, product_schema.description],
-    model="sentence-transformers/all-distilroberta-v1",
-)
-name_space = TextSimilaritySpace(
-    text=[user_schema.preference_name, product_schema.name],
-    model="sentence-transformers/all-distilroberta-v1",
-)
-category_space = TextSimilaritySpace(
-    text=[user_schema.preference_category, product_schema.category],
-    model="sentence-transformers/all-distilroberta-v1",
-)
-price_space = NumberSpace(
-    number=product_schema.price, mode=Mode.MINIMUM, min_value=25, max_value=1000
-)
-review_count_space = NumberSpace(
-    number=product_schema.review_count, mode=Mode.MAXIMUM, min_value=0, max_value=100
-)
-review_rating_space = NumberSpace(
-    number=product_schema.review_rating, mode=Mode.MAXIMUM, min_value=0, max_value=4
-)
+# Define spaces, the text spaces load their model here
+with startup.phase("define_spaces"):
+    description_space = TextSimilaritySpace(
+        text=[user_schema.preference_description, product_schema.description],
+        model=text_model,
+    )
+    name_space = TextSimilaritySpace(
+        text=[user_schema.preference_name, product_schema.name],
+        model=text_model,
+    )
+    category_space = TextSimilaritySpace(
+        text=[user_schema.preference_category, product_schema.category],
+        model=text_model,
+    )
+    price_space = NumberSpace(
+        number=product_schema.price, mode=Mode.MINIMUM, min_value=25, max_value=1000
+    )
+    review_count_space = NumberSpace(
+        number=product_schema.review_count, mode=Mode.MAXIMUM, min_value=0, max_value=100
+    )
+    review_rating_space = NumberSpace(
+        number=product_schema.review_rating, mode=Mode.MAXIMUM, min_value=0, max_value=4
+    )
 
 # Define event weights
 event_weights = {
@@ -147,13 +166,17 @@ source_product: RestSource = RestSource(product_schema)
 source_user: RestSource = RestSource(user_schema)
 source_event: RestSource = RestSource(event_schema)
 
-redis_vector_database = RedisVectorDatabase("redis-18118.c328.europe-west3-1.gce.cloud.redislabs.com", 18118, username="default", password="*****")
+with startup.phase("create_executor"):
+    redis_vector_database = RedisVectorDatabase(redis_host, redis_port, username="default", password="*****")
 
-executor = RestExecutor(
-    sources=[source_product, source_user, source_event],
-    indices=[index],
-    queries=[RestQuery(RestDescriptor("query"), query)],
-    vector_database=redis_vector_database,
-)
+    executor = RestExecutor(
+        sources=[source_product, source_user, source_event],
+        indices=[index],
+        queries=[RestQuery(RestDescriptor("query"), query)],
+        vector_database=redis_vector_database,
+    )
 
 SuperlinkedRegistry.register(executor)
+
+# Reports ready once the server is up and warm
+startup.serve_readiness(prefetch_threads)
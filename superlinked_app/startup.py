@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Fetch the text model in the background while the framework is imported
+startup_prefetch = os.getenv("startup_prefetch", "true").lower() == "true"
+# Port of the Superlinked REST API, where the warm-up queries are sent
+server_port = int(os.getenv("server_port", "8080"))
+# Port of the /ready and /live endpoints
+readiness_port = int(os.getenv("readiness_port", "8090"))
+# Warm-up: each round runs the recommendation query for every user, which only reads
+warmup_rounds = int(os.getenv("warmup_rounds", "3"))
+warmup_user_ids = [user_id for user_id in os.getenv("warmup_user_ids", "user_1,user_2").split(",") if user_id]
+warmup_timeout = float(os.getenv("warmup_timeout", "300"))
+
+started_at = time.perf_counter()
+phases = {}  # phase name -> seconds
+ready = threading.Event()
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Time a phase of the startup, reported by the readiness endpoint and in the logs.
+    """
+    phase_started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = round(time.perf_counter() - phase_started, 3)
+        logger.info(f"Startup phase '{name}' took {phases[name]:.2f}s")
+
+
+def _fetch_model(model: str):
+    with phase(f"fetch_model:{model}"):
+        # The spaces load the model themselves, this only gets its files ready for them: downloaded
+        # on the first start of a replica, and read once so they are in the page cache
+        from huggingface_hub import snapshot_download
+        path = snapshot_download(model)
+        for directory, _, files in os.walk(path):
+            for name in files:
+                with open(os.path.join(directory, name), "rb") as f:
+                    while f.read(1 << 24):
+                        pass
+
+
+def prefetch(models: list):
+    """
+    Start fetching the files of the models in parallel, returns the threads.
+
+    Args:
+        - models: names of the sentence-transformers models used by the spaces
+    """
+    if not startup_prefetch:
+        return []
+    threads = [threading.Thread(target=_run_logged, args=(_fetch_model, model), name=f"prefetch-{model}", daemon=True)
+               for model in set(models)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def _run_logged(target, *args):
+    try:
+        target(*args)
+    except Exception:
+        # Only a head start, the spaces load the model anyway
+        logger.exception(f"Prefetch with {target.__name__}{args} failed")
+
+
+def _server_up() -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", server_port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+def _post(path: str, payload: dict):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{server_port}{path}", data=json.dumps(payload).encode(),
+        headers={"Accept": "*/*", "Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+
+
+def _query(user_id: str):
+    payload = {
+        "user_id": user_id,
+        "query_text": "",
+        "description_weight": 1,
+        "category_weight": 1,
+        "name_weight": 1,
+        "price_weight": 1,
+        "review_count_weight": 1,
+        "review_rating_weight": 1,
+        "limit": 10,
+    }
+    # Raises HTTPError unless the query succeeded
+    _post("/api/v1/search/query", payload)
+
+
+def warm_up(prefetch_threads: list):
+    """
+    Wait for the REST API to come up, then pay the lazy initialization costs of
+    the first requests before reporting ready, by running the recommendation
+    query, which writes nothing, for the warm-up users. Ready is only reported
+    once `warmup_rounds` rounds in a row succeeded for all of them, failed
+    rounds are retried until `warmup_timeout`.
+    """
+    deadline = time.monotonic() + warmup_timeout
+    with phase("wait_for_server"):
+        while not _server_up():
+            if time.monotonic() > deadline:
+                logger.error(f"The Superlinked server didn't listen on port {server_port} "
+                             f"within {warmup_timeout}s, not ready")
+                return
+            time.sleep(0.5)
+
+    for thread in prefetch_threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+
+    with phase("warm_up"):
+        rounds = 0
+        while rounds < warmup_rounds:
+            try:
+                for user_id in warmup_user_ids:
+                    _query(user_id)
+                rounds += 1
+            except (urllib.error.URLError, OSError) as e:
+                # Also an HTTPError, e.g. for a user that doesn't exist or Redis not answering yet
+                rounds = 0
+                if time.monotonic() > deadline:
+                    logger.error(f"Warm-up queries still failing after {warmup_timeout}s, not ready: {e}")
+                    return
+                logger.warning(f"Warm-up query failed, retrying: {e}")
+                time.sleep(1)
+
+    phases["total"] = round(time.perf_counter() - started_at, 3)
+    ready.set()
+    logger.info(f"Ready after {phases['total']:.2f}s: {phases}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/live":
+            status = 200
+        elif self.path == "/ready":
+            status = 200 if ready.is_set() else 503
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps({"ready": ready.is_set(), "phases": phases}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_readiness(prefetch_threads: list):
+    """
+    Serve /ready, answering 503 until the warm-up is done, and /live, then start the warm-up.
+    """
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", readiness_port), _Handler)
+    except OSError:
+        # The app definition is loaded by more than one process of the server, only one serves readiness
+        logger.info(f"Readiness port {readiness_port} is already in use, not serving it from this process")
+        return
+    threading.Thread(target=server.serve_forever, name="readiness", daemon=True).start()
+    threading.Thread(target=warm_up, args=(prefetch_threads,), name="warm-up", daemon=True).start()
+    logger.info(f"Serving readiness on port {readiness_port}")